@@ -43,7 +43,8 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware", 
+    # async-capable WhiteNoise, so ASGI requests stay async end to end
+    "core.middleware.WhiteNoiseMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,20 +52,24 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
 ]
 
 AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    ),
+    # Bearer tokens are resolved once per request by core.auth.require_auth;
+    # running JWTAuthentication as well would load the user a second time.
+    'DEFAULT_AUTHENTICATION_CLASSES': (),
 }
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
 }
 
+# Max verified access tokens kept in-process by core.token_cache
+JWT_CACHE_MAX_ENTRIES = int(get_env("JWT_CACHE_MAX_ENTRIES", "10000"))
+
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
 ROOT_URLCONF = 'config.urls'
@@ -87,19 +92,109 @@ TEMPLATES = [
 WSGI_APPLICATION = 'config.wsgi.application'
 
 
+# Cache
+# Redis when REDIS_URL is set (shared by all workers); otherwise a per-process
+# local-memory cache, which is only suitable for dev/test since signal-based
+# invalidation cannot reach other processes.
+
+REDIS_URL = get_env("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_URL,
+            "OPTIONS": {
+                "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                # a Redis outage degrades to cache misses instead of 500s
+                "IGNORE_EXCEPTIONS": True,
+            },
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "clinicconnect",
+        }
+    }
+
+# Whether every web process sees the same cache. Read-your-writes pins
+# (core.replicas) and authz epoch invalidations only work across processes
+# when it does.
+SHARED_CACHE = bool(REDIS_URL)
+
+# Seconds a cached profile lookup (core.profile_cache) may live
+PROFILE_CACHE_TTL = int(get_env("PROFILE_CACHE_TTL", "300"))
+
+# Seconds a user's authz epoch may be cached. Only a shared cache sees the
+# invalidation in bump_authz_epoch, so without Redis every request reads it
+# from the database; with Redis a short TTL bounds a lost invalidation.
+AUTHZ_EPOCH_CACHE_TTL = int(get_env("AUTHZ_EPOCH_CACHE_TTL", "60" if SHARED_CACHE else "0"))
+
+
+# Serve the read-only endpoints and document downloads from the async views
+# (core.views_async); only worthwhile when deployed under an ASGI server
+ASYNC_VIEWS = get_env("ASYNC_VIEWS", "0") == "1"
+
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
+def _sqlite_database(name):
+    return {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": name,
+        # web and run_worker processes write concurrently: take the write lock
+        # when a transaction starts (waiting up to `timeout` seconds) instead
+        # of failing on lock upgrade, and let readers run alongside a writer
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+            "init_command": "PRAGMA journal_mode=WAL;",
+        },
+        # keep connections open between requests (0 closes them after each
+        # one, which is what async views want: their threads are per-request)
+        "CONN_MAX_AGE": int(get_env("DATABASE_CONN_MAX_AGE", "0" if ASYNC_VIEWS else "60")),
+        "CONN_HEALTH_CHECKS": True,
     }
+
+
+DATABASES = {
+    "default": _sqlite_database(BASE_DIR / "db.sqlite3"),
 }
 
+# Read replicas (core.replicas): comma-separated database files, each kept
+# up to date by replication (`manage.py sync_replicas` for local SQLite
+# copies). Ignored, with every read going to the primary, unless
+# SHARED_CACHE: a caller's pin must reach whichever process serves their next
+# request. Under test they mirror the default database; the routing tests in
+# core.tests set up separate replica files of their own.
+DATABASE_REPLICAS = []
+for _index, _name in enumerate(filter(None, get_env("DATABASE_REPLICAS", "").split(",")), start=1):
+    DATABASES[f"replica{_index}"] = {**_sqlite_database(_name.strip()), "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(f"replica{_index}")
+
+DATABASE_ROUTERS = ["core.replicas.ReplicaRouter"]
+
+# How long a caller's reads stay on the primary after they write (seconds);
+# must exceed the replication lag for read-your-writes
+DATABASE_REPLICA_PIN_SECONDS = int(get_env("DATABASE_REPLICA_PIN_SECONDS", "5"))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+# Login checks passwords through the hashing pool (core.hashing)
+AUTHENTICATION_BACKENDS = ["core.backends.PooledPasswordBackend"]
+
+# Password hashing pool, per web process: worker processes (0 hashes on the
+# request thread), most operations queued or running at once, how long a
+# request waits for a slot before getting 503, and the Retry-After it sends
+PASSWORD_HASH_WORKERS = int(get_env("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(get_env("PASSWORD_HASH_MAX_PENDING", "32"))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(get_env("PASSWORD_HASH_QUEUE_TIMEOUT", "2"))
+PASSWORD_HASH_RETRY_AFTER = 2
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -136,9 +231,47 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Keyset pagination (core.pagination); clients may ask for up to the max
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+# Rows fetched per round trip by the NDJSON export (core.export)
+EXPORT_CHUNK_SIZE = 2000
+
+# Upper bound on how stale cached directory facet counts may get (seconds)
+DIRECTORY_FACETS_TTL = 300
+
 # Maximum upload size ~5MB
 MAX_UPLOAD_SIZE = 5 * 1024 * 1024
 
+# Most files accepted by one batch upload (each still capped at MAX_UPLOAD_SIZE)
+BATCH_UPLOAD_MAX_FILES = 50
+
+# Background jobs (core.jobs, run by `manage.py run_worker`): attempts before a
+# job is marked failed, base retry delay (doubles per attempt, seconds), and
+# how long a job may stay locked before another worker takes it over
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30
+JOB_LOCK_TIMEOUT = 10 * 60
+
+# Extracted PDF text kept per document for full-text search (characters)
+DOCUMENT_TEXT_MAX_CHARS = 1_000_000
+
+# Resumable uploads (core.resumable): total size cap, largest single PUT, how
+# long an idle session (and its partial file) is kept, and how long a PUT that
+# stopped responding keeps other PUTs to its session out
+RESUMABLE_UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+RESUMABLE_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+RESUMABLE_CHUNK_LOCK_TIMEOUT = 10 * 60
+
+# Document downloads can be offloaded to the front proxy once authorized:
+# '' (Django streams the file), 'x-accel-redirect' (nginx; requests are
+# redirected to an internal location serving MEDIA_ROOT at the prefix below)
+# or 'x-sendfile' (Apache mod_xsendfile, lighttpd; absolute path)
+DOCUMENT_SENDFILE = os.environ.get('DOCUMENT_SENDFILE', '')
+DOCUMENT_SENDFILE_PREFIX = os.environ.get('DOCUMENT_SENDFILE_PREFIX', '/protected-media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
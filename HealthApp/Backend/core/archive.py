@@ -0,0 +1,56 @@
+"""Streamed ZIP archives of stored documents.
+
+``iter_zip`` produces the archive as it goes: ``zipfile`` writes into a
+non-seekable sink (so it emits data descriptors instead of seeking back to
+patch headers), and whatever it has written is yielded after every chunk read
+from disk. Memory stays at one read chunk per entry regardless of archive
+size, and the first bytes go out before the second file is opened. PDFs are
+already compressed, so entries are stored rather than deflated.
+"""
+import zipfile
+from collections import deque
+
+ZIP_CHUNK_SIZE = 64 * 1024
+
+
+class _StreamSink:
+    """Write-only file object that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self.pending = deque()
+
+    def write(self, data):
+        self.pending.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        while self.pending:
+            yield self.pending.popleft()
+
+
+def iter_zip(entries):
+    """Yield a ZIP archive of ``(arcname, path, date_time)`` entries chunk by chunk.
+
+    ``date_time`` is a ``datetime``; entries whose file cannot be opened are
+    left out.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for arcname, path, date_time in entries:
+            try:
+                source = open(path, 'rb')
+            except OSError:
+                continue
+            with source:
+                info = zipfile.ZipInfo(arcname, date_time=date_time.timetuple()[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                # sizes are unknown up front to a non-seekable writer
+                with archive.open(info, mode='w', force_zip64=True) as member:
+                    for chunk in iter(lambda: source.read(ZIP_CHUNK_SIZE), b''):
+                        member.write(chunk)
+                        yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
@@ -1,14 +1,17 @@
 import jwt
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db.models import F, OuterRef, Subquery
 from rest_framework.response import Response
 from rest_framework import status
 from functools import wraps
 
-from .validators import is_clinician
 from .models import Clinician, User, Patient, Document
-from .serializers import UserSerializer
+from .token_cache import token_cache
+from .profile_cache import aget_authz_epoch, get_authz_epoch, invalidate_epoch
 
 JWT_ALG = 'HS256'
+AUTHZ_EPOCH_CLAIM = 'authz_epoch'
 
 
 def _decode_bearer(request):
@@ -16,29 +19,148 @@ def _decode_bearer(request):
     if not auth.startswith('Bearer '):
         return None
     token = auth.split()[1]
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[JWT_ALG])
-        return payload
     except Exception:
         return None
+    token_cache.set(token, payload)
+    return payload
 
 
-def get_request_user(request):
+def _as_id(value):
+    """Coerce a URL/body id to int; None when it is not a valid id."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Principal:
+    """The authenticated caller, resolved once per request.
+
+    Carries the caller's own patient/clinician ids so views and permission
+    checks never need to re-query them. A user may own several patients:
+    ``patient_ids`` holds all of them, ``patient_id`` the lowest (the one
+    shown on the user's profile). The full ``User`` row is only loaded when a
+    view asks for ``principal.user``.
+    """
+
+    is_authenticated = True
+
+    def __init__(self, user_id, username, patient_ids=(), clinician_id=None, user=None):
+        self.user_id = user_id
+        self.username = username
+        self.patient_ids = tuple(sorted(patient_ids))
+        self.patient_id = self.patient_ids[0] if self.patient_ids else None
+        self.clinician_id = clinician_id
+        self._user = user
+
+    @classmethod
+    def from_claims(cls, payload):
+        patient_ids = payload.get('patient_ids')
+        if patient_ids is None:
+            # issued before patient_ids was signed in
+            patient_ids = [payload['patient_id']] if payload.get('patient_id') is not None else []
+        return cls(
+            payload['user_id'],
+            payload.get('username'),
+            patient_ids=patient_ids,
+            clinician_id=payload.get('clinician_id'),
+        )
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = User.objects.get(id=self.user_id)
+        return self._user
+
+    @property
+    def is_clinician(self):
+        return self.clinician_id is not None
+
+    @property
+    def is_patient(self):
+        return self.patient_id is not None
+
+    def __str__(self):
+        return self.username
+
+
+def load_principal(user_id):
+    """Fetch user + own patient/clinician ids in a single query.
+
+    Joined on the user's patients: one row per owned patient, or a single
+    row with no patient.
+    """
+    clinicians = Clinician.objects.filter(user_id=OuterRef('pk')).order_by('clinician_id').values('clinician_id')[:1]
+    rows = list(
+        User.objects
+        .annotate(own_patient_id=F('patients__patient_id'), own_clinician_id=Subquery(clinicians))
+        .filter(id=user_id, is_active=True)
+        .order_by('own_patient_id')
+    )
+    if not rows:
+        return None
+    user = rows[0]
+    return Principal(
+        user.id, user.username,
+        patient_ids=[row.own_patient_id for row in rows if row.own_patient_id is not None],
+        clinician_id=user.own_clinician_id, user=user,
+    )
+
+
+def current_authz_epoch(user_id):
+    """Current authz epoch of an active user, or None if the user is gone."""
+    return get_authz_epoch(user_id)
+
+
+def bump_authz_epoch(user_id):
+    """Invalidate role claims in every access token issued to ``user_id``."""
+    User.objects.filter(id=user_id).update(authz_epoch=F('authz_epoch') + 1)
+    invalidate_epoch(user_id)
+
+
+def get_request_principal(request):
     payload = _decode_bearer(request)
     if not payload:
         return None
     uid = payload.get('user_id')
     if uid is None:
         return None
-    try:
-        return User.objects.get(id=uid)
-    except User.DoesNotExist:
+    if AUTHZ_EPOCH_CLAIM in payload:
+        # Role claims are signed into the token; only check they are current.
+        if current_authz_epoch(uid) != payload[AUTHZ_EPOCH_CLAIM]:
+            return None
+        return Principal.from_claims(payload)
+    return load_principal(uid)
+
+
+async def aget_request_principal(request):
+    """``get_request_principal`` for async views; same rules, awaited lookups."""
+    payload = _decode_bearer(request)
+    if not payload:
+        return None
+    uid = payload.get('user_id')
+    if uid is None:
         return None
+    if AUTHZ_EPOCH_CLAIM in payload:
+        if await aget_authz_epoch(uid) != payload[AUTHZ_EPOCH_CLAIM]:
+            return None
+        return Principal.from_claims(payload)
+    return await sync_to_async(load_principal)(uid)
+
+
+def get_request_user(request):
+    principal = get_request_principal(request)
+    return principal.user if principal else None
 
 
 # --- Permission decorators --------------------------------------------------
 
-# Usage: @require_auth  (ensures request.user_obj is set)
+# Usage: @require_auth  (ensures request.principal is set)
 #        @require_role('Clinician')
 #        @require_patient_or_clinician
 
@@ -46,35 +168,59 @@ def get_request_user(request):
 def require_auth(view_func):
     @wraps(view_func)
     def _wrapped(self, request, *args, **kwargs):
-        user_obj = get_request_user(request)
-        if not user_obj:
+        principal = get_request_principal(request)
+        if not principal:
             return Response({'detail': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
-        request.user_obj = user_obj
+        request.principal = principal
         return view_func(self, request, *args, **kwargs)
     return _wrapped
 
-def check_patient_access(user_id, patient_id):
+def check_patient_access(principal, patient_id):
     """Return True if user allowed to access patient record."""
-    if is_clinician(user_id=user_id):
-        return True 
-    else:
-        try:
-            patient = Patient.objects.get(patient_id=patient_id)
-        except Patient.DoesNotExist:
-            return False
-        return patient.user_id == user_id
+    if principal.is_clinician:
+        return True
+    return _as_id(patient_id) in principal.patient_ids
 
 
-def check_document_delete(user_id, document: Document):
+def check_document_delete(principal, document: Document):
     """Delete allowed if patient owner OR uploader."""
     # patient owner match
-    if document.uploaded_by.id == user_id:
+    if document.uploaded_by_id == principal.user_id:
         return True
     return False
 
-def check_clinician_access(user_id, clinician_id):
-    try:
-        clinician = Clinician.objects.get(clinician_id=clinician_id)
-    except Clinician.DoesNotExist:
-        return False
-    return clinician.user_id == user_id
\ No newline at end of file
+def check_clinician_access(principal, clinician_id):
+    return principal.clinician_id is not None and principal.clinician_id == _as_id(clinician_id)
+
+
+# --- Queryset scoping -------------------------------------------------------
+
+# Same rules as the check_* helpers above, expressed as filters so list,
+# detail and delete views enforce access in the query that fetches the rows.
+
+
+def visible_patients(principal, queryset=None):
+    """Patients the principal may read: all for clinicians, else their own."""
+    queryset = Patient.objects.all() if queryset is None else queryset
+    if principal.is_clinician:
+        return queryset
+    return queryset.filter(user_id=principal.user_id)
+
+
+def visible_clinicians(principal, queryset=None):
+    """Clinician profiles the principal may read: only their own."""
+    queryset = Clinician.objects.all() if queryset is None else queryset
+    return queryset.filter(user_id=principal.user_id)
+
+
+def visible_documents(principal, queryset=None):
+    """Documents belonging to a patient visible to the principal."""
+    queryset = Document.objects.all() if queryset is None else queryset
+    if principal.is_clinician:
+        return queryset
+    return queryset.filter(patient__user_id=principal.user_id)
+
+
+def deletable_documents(principal, queryset=None):
+    """Visible documents the principal may delete (mirrors check_document_delete)."""
+    return visible_documents(principal, queryset).filter(uploaded_by_id=principal.user_id)
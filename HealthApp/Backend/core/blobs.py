@@ -0,0 +1,73 @@
+"""Reference counting for content-addressed document blobs.
+
+Every ``Document`` whose file is a blob holds one reference on the matching
+``DocumentBlob`` row. ``ContentAddressedStorage`` takes the reference when it
+names the blob (see ``core.storage``); the Document delete signal in
+``core.signals`` drops it, so cascaded deletes are counted too. Dropping the
+last reference queues a file deletion job in the same transaction; the worker
+unlinks the file only if no new reference appeared in the meantime, checking
+under the database write lock that taking a reference also needs.
+
+``schedule_file_deletion`` is how every stored file gets removed: deletion
+happens off the request path and is retried when the filesystem errors.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .jobs import enqueue
+from .models import DocumentBlob
+from .storage import blob_name, document_storage
+
+DELETE_FILE = 'delete_stored_file'
+
+
+def schedule_file_deletion(name, digest=None):
+    """Queue removal of a stored file (a blob only while ``digest`` stays unreferenced)."""
+    enqueue(DELETE_FILE, name=name, digest=digest)
+
+
+def acquire_blobs(blobs):
+    """Add references for ``{digest: (name, size, count)}`` in a few queries.
+
+    Missing rows are inserted with no references first (a concurrent insert
+    of the same digest is simply ignored), then counts are added with one
+    UPDATE per distinct count. Call it in the transaction that stores the
+    files and inserts the referencing Documents.
+    """
+    by_count = defaultdict(list)
+    for digest, (_, _, count) in blobs.items():
+        by_count[count].append(digest)
+    with transaction.atomic():
+        DocumentBlob.objects.bulk_create(
+            [DocumentBlob(sha256=digest, name=name, size=size, ref_count=0)
+             for digest, (name, size, _) in blobs.items()],
+            ignore_conflicts=True,
+        )
+        for count, digests in by_count.items():
+            DocumentBlob.objects.filter(sha256__in=digests).update(ref_count=F('ref_count') + count)
+
+
+def release_blob(digest):
+    """Drop a reference; queue the file for removal if it was the last one."""
+    with transaction.atomic():
+        blob = DocumentBlob.objects.select_for_update().filter(sha256=digest).first()
+        if blob is None:
+            # never counted: no other Document can be relying on the row
+            schedule_file_deletion(blob_name(digest), digest)
+            return
+        if blob.ref_count > 1:
+            DocumentBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') - 1)
+            return
+        blob.delete()
+        schedule_file_deletion(blob.name, digest)
+
+
+def discard_unreferenced(digest, name):
+    """Unlink a blob file unless some Document references it again."""
+    # checked and unlinked under the write lock, so a reference cannot be
+    # taken (and the existing file reused) between the two
+    with transaction.atomic():
+        if not DocumentBlob.objects.select_for_update().filter(sha256=digest).exists():
+            document_storage().delete(name)
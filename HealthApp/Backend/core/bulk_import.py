@@ -0,0 +1,228 @@
+"""Bulk creation of patients and clinicians from CSV or NDJSON records.
+
+``import_records`` validates each record with the same rules as
+RegisterPatient / RegisterClinician and hashes passwords in a process pool,
+one batch ahead of the inserts. Each batch's users and profiles are created
+with ``bulk_create`` in a single transaction. The same transaction advances
+the ``ImportRun``, so an interrupted import resumes after its last committed
+batch.
+
+``bulk_create`` bypasses ``save()`` and the signal handlers, so this module
+does their work itself: it sets ``speciality_key``, indexes patients for
+search and drops the directory facets cache.
+"""
+import csv
+import json
+import random
+from collections import namedtuple
+
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import User, Patient, Clinician, ImportRun, normalize_speciality
+from .search import index_patients
+from .directory import invalidate_speciality_facets
+from .hashing import process_pool
+
+FORMATS = ('csv', 'ndjson')
+
+# a username taken between the check and the insert (a live registration)
+# fails the batch; it is retried with fresh usernames this many times
+USERNAME_ATTEMPTS = 3
+
+BatchResult = namedtuple('BatchResult', 'position imported skipped errors usernames')
+
+
+def read_records(path, fmt):
+    """Yield ``(number, record, error)`` for each record, streaming the file.
+
+    ``number`` counts records from 1 (CSV rows after the header, non-blank
+    NDJSON lines); ``error`` is set when the record could not be parsed.
+    """
+    with open(path, newline='', encoding='utf-8') as source:
+        if fmt == 'csv':
+            for number, record in enumerate(csv.DictReader(source), start=1):
+                yield number, record, None
+            return
+        number = 0
+        for line in source:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield number, None, 'invalid JSON'
+                continue
+            if not isinstance(record, dict):
+                yield number, None, 'expected a JSON object'
+                continue
+            yield number, record, None
+
+
+def _field(record, name):
+    value = record.get(name)
+    return value.strip() if isinstance(value, str) else value
+
+
+def _age(record):
+    try:
+        return int(_field(record, 'age'))
+    except (TypeError, ValueError):
+        raise ValueError('age must be an integer')
+
+
+def _clean_patient(record):
+    age, sex = _age(record), _field(record, 'sex')
+    if not age or not sex:
+        raise ValueError('Age and Sex required')
+    if sex not in ('Male', 'Female'):
+        raise ValueError('Sex should be Male or Female')
+    return {'age': age, 'sex': sex, 'health_description': _field(record, 'health_description') or ''}
+
+
+def _clean_clinician(record):
+    age, speciality = _age(record), _field(record, 'speciality')
+    if not age or not speciality:
+        raise ValueError('Age and speciality required')
+    gender = _field(record, 'gender')
+    if gender not in ('Male', 'Female', 'Not disclosed'):
+        gender = 'Not disclosed'
+    # what Clinician.save() would have derived
+    return {'age': age, 'gender': gender, 'speciality': speciality,
+            'speciality_key': normalize_speciality(speciality)}
+
+
+KINDS = {
+    'patients': (Patient, _clean_patient),
+    'clinicians': (Clinician, _clean_clinician),
+}
+
+
+def clean_record(kind, record):
+    """``(user fields, profile fields, password)``; ValueError if invalid."""
+    first_name = _field(record, 'first_name')
+    if not first_name:
+        raise ValueError('First name required')
+    user_fields = {'first_name': first_name[:150], 'last_name': (_field(record, 'last_name') or '')[:150]}
+    # no password: the account gets an unusable one until it is reset
+    password = record.get('password') or None
+    return user_fields, KINDS[kind][1](record), password
+
+
+def _username_base(first_name):
+    # RegisterUser's scheme: <first name>_<digits>
+    return first_name.lower()[:140]
+
+
+def assign_usernames(first_names):
+    """One unused username per first name, in RegisterUser's format.
+
+    Candidates are checked against the database and each other in one query
+    per round; collisions get new suffixes, longer ones once a name is busy.
+    """
+    usernames = [None] * len(first_names)
+    pending = list(range(len(first_names)))
+    taken = set()
+    digits = 5
+    while pending:
+        candidates = {
+            i: f'{_username_base(first_names[i])}_{random.randint(10 ** (digits - 1), 10 ** digits - 1)}'
+            for i in pending
+        }
+        existing = set(User.objects.filter(username__in=candidates.values()).values_list('username', flat=True))
+        pending = []
+        for i, name in candidates.items():
+            if name in existing or name in taken:
+                pending.append(i)
+            else:
+                usernames[i] = name
+                taken.add(name)
+        digits += 1 if pending else 0
+    return usernames
+
+
+def _insert_batch(kind, run, rows, hashes, position, skipped):
+    model = KINDS[kind][0]
+    for attempt in range(USERNAME_ATTEMPTS):
+        usernames = assign_usernames([user_fields['first_name'] for _, user_fields, _ in rows])
+        try:
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=username, password=encoded, **user_fields)
+                    for username, encoded, (_, user_fields, _) in zip(usernames, hashes, rows)
+                ])
+                profiles = model.objects.bulk_create([
+                    model(user=user, **profile_fields) for user, (_, _, profile_fields) in zip(users, rows)
+                ])
+                if kind == 'patients':
+                    index_patients([patient.patient_id for patient in profiles])
+                elif profiles:
+                    transaction.on_commit(invalidate_speciality_facets)
+                # a queryset update skips auto_now
+                ImportRun.objects.filter(pk=run.pk).update(
+                    position=position, imported=F('imported') + len(users), skipped=F('skipped') + skipped,
+                    updated_at=timezone.now(),
+                )
+            return [(number, user.username) for (number, _, _), user in zip(rows, users)]
+        except IntegrityError:
+            if attempt == USERNAME_ATTEMPTS - 1:
+                raise
+
+
+def import_records(kind, records, run, batch_size=500, workers=0):
+    """Import ``records`` (from ``read_records``) past ``run.position``.
+
+    Yields a ``BatchResult`` per committed batch. ``workers`` processes hash
+    the passwords (0 hashes inline).
+    """
+    pool = process_pool(workers) if workers > 0 else None
+
+    def start_hashing(passwords):
+        if pool is None:
+            return [make_password(p) for p in passwords]
+        # submitted now, collected when the batch is inserted
+        return pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4)))
+
+    def batches():
+        rows, errors, position = [], [], run.position
+        for number, record, error in records:
+            if number <= run.position:
+                continue  # committed by an earlier attempt
+            position = number
+            if error is None:
+                try:
+                    user_fields, profile_fields, password = clean_record(kind, record)
+                    rows.append(((number, user_fields, profile_fields), password))
+                except ValueError as exc:
+                    error = str(exc)
+            if error is not None:
+                errors.append((number, error))
+            if len(rows) >= batch_size:
+                yield rows, errors, position
+                rows, errors = [], []
+        if rows or errors:
+            yield rows, errors, position
+
+    def flush(batch):
+        rows, hashes, errors, position = batch
+        usernames = _insert_batch(kind, run, rows, list(hashes), position, len(errors))
+        return BatchResult(position, len(rows), len(errors), errors, usernames)
+
+    try:
+        pending = None
+        for rows, errors, position in batches():
+            hashes = start_hashing([password for _, password in rows])
+            batch = ([row for row, _ in rows], hashes, errors, position)
+            if pending is not None:
+                yield flush(pending)
+            pending = batch
+        if pending is not None:
+            yield flush(pending)
+        now = timezone.now()
+        ImportRun.objects.filter(pk=run.pk).update(finished_at=now, updated_at=now)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
@@ -0,0 +1,49 @@
+"""Per-patient document change feed for incremental sync.
+
+Every document creation, update (e.g. text extraction filling ``page_count``)
+and deletion appends a ``DocumentChange`` row numbered with the patient's new
+``documents_version``. The version is bumped with an UPDATE on the patient
+row, which serializes concurrent writers for that patient, so sequence
+numbers are handed out and committed in order: a client that has seen ``seq``
+N has seen every change numbered N or lower. Deletions leave tombstones, so
+clients holding a copy of a document learn that it is gone.
+
+``record_document_changes`` is called by the Document signals and directly by
+code that bypasses them (``bulk_create``, queryset updates). Since the version
+also feeds the documents list ETag (GetDocuments), recording a change
+invalidates it.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Patient, DocumentChange
+
+
+def record_document_changes(patient_id, changes):
+    """Append ``[(document_id, kind), ...]`` to the patient's feed."""
+    if not changes:
+        return
+    with transaction.atomic():
+        patients = Patient.objects.filter(patient_id=patient_id)
+        patients.update(
+            documents_version=F('documents_version') + len(changes),
+            documents_updated_at=timezone.now(),
+        )
+        version = patients.values_list('documents_version', flat=True).first()
+        if version is None:
+            return  # the patient itself is being deleted
+        first = version - len(changes) + 1
+        DocumentChange.objects.bulk_create([
+            DocumentChange(patient_id=patient_id, seq=seq, document_id=document_id, kind=kind)
+            for seq, (document_id, kind) in enumerate(changes, start=first)
+        ])
+
+
+def changes_since(patient_id, since, limit):
+    """Up to ``limit`` changes numbered above ``since``, oldest first."""
+    return list(DocumentChange.objects.filter(patient_id=patient_id, seq__gt=since).order_by('seq')[:limit])
+
+
+async def achanges_since(patient_id, since, limit):
+    return [row async for row in DocumentChange.objects.filter(patient_id=patient_id, seq__gt=since).order_by('seq')[:limit]]
@@ -0,0 +1,39 @@
+"""ETag / Last-Modified helpers for conditional GETs.
+
+Views compute validators from a cheap version lookup (``updated_at`` columns,
+``Patient.documents_version``) and call ``not_modified`` before doing any
+serialization work; a 304 costs that single lookup.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """Strong ETag over the given version components."""
+    digest = hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def last_modified_of(*datetimes):
+    """Latest of the given datetimes as a POSIX timestamp (None if none set)."""
+    stamps = [int(dt.timestamp()) for dt in datetimes if dt is not None]
+    return max(stamps) if stamps else None
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # private data: browsers may keep it but must revalidate every time
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """304 (or 412) response if the client's validators are current, else None."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
@@ -0,0 +1,40 @@
+"""Clinician directory facets (clinician count per speciality).
+
+The GROUP BY result is cached and dropped by the Clinician signal handlers
+in ``core.signals`` whenever a clinician is created, edited or removed, so
+directory page loads normally read it straight from the cache.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min
+
+from .models import Clinician
+from .replicas import use_primary
+
+FACETS_CACHE_KEY = 'core:clinician-speciality-facets'
+
+
+def _compute_facets():
+    rows = (
+        Clinician.objects
+        .values('speciality_key')
+        .annotate(label=Min('speciality'), count=Count('clinician_id'))
+        .order_by('speciality_key')
+    )
+    return [
+        {'speciality': ' '.join(r['label'].split()), 'key': r['speciality_key'], 'count': r['count']}
+        for r in rows
+    ]
+
+
+def speciality_facets():
+    facets = cache.get(FACETS_CACHE_KEY)
+    if facets is None:
+        with use_primary():
+            facets = _compute_facets()
+        cache.set(FACETS_CACHE_KEY, facets, getattr(settings, 'DIRECTORY_FACETS_TTL', 300))
+    return facets
+
+
+def invalidate_speciality_facets():
+    cache.delete(FACETS_CACHE_KEY)
@@ -0,0 +1,202 @@
+"""File responses for document downloads: byte ranges and sendfile offload.
+
+``file_response`` answers conditional requests (304) from the validators, then
+either hands the transfer to the front proxy (``DOCUMENT_SENDFILE``) or serves
+the file itself: the whole file, a single ``Range`` (206), or several ranges as
+``multipart/byteranges``. Ranges are read in chunks, never whole into memory.
+
+With ``asynchronous=True`` (the async views) the body is an async iterator
+whose reads run in a thread one chunk at a time, so a slow client holds only
+a suspended coroutine, not a worker thread. Django would otherwise drain a
+sync iterator into memory before sending it over ASGI.
+"""
+import asyncio
+import os
+import re
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags, parse_http_date_safe
+
+from .conditional import not_modified, set_validators
+
+RANGE_CHUNK_SIZE = 64 * 1024
+
+# More ranges than this are answered with the whole file (RFC 9110 14.2 allows it)
+MAX_RANGES = 16
+
+RANGE_SPEC_RE = re.compile(r'^(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(header, size):
+    """Byte ranges as sorted, coalesced ``(start, end)`` pairs (inclusive).
+
+    Returns None when the whole file should be served (no header, another
+    unit, malformed or too many ranges) and raises ``RangeNotSatisfiable``
+    when no requested range overlaps the file.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.split(','):
+        match = RANGE_SPEC_RE.match(part.strip())
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first == '':
+            # suffix range: the last N bytes
+            length = int(last)
+            if length == 0 or size == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(int(last), size - 1) if last else size - 1))
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > MAX_RANGES:
+        return None
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(request, etag, last_modified):
+    """Whether a ``Range`` may be honoured given the client's ``If-Range``."""
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        # strong comparison only
+        return not value.startswith('W/') and parse_etags(value) == [etag]
+    return last_modified is not None and parse_http_date_safe(value) == last_modified
+
+
+def _read_ranges(path, ranges, closing=b''):
+    with open(path, 'rb') as handle:
+        for start, end, prefix in ranges:
+            if prefix:
+                yield prefix
+            handle.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = handle.read(min(RANGE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+            if prefix:
+                yield b'\r\n'
+    if closing:
+        yield closing
+
+
+async def _aread_ranges(path, ranges, closing=b''):
+    handle = await asyncio.to_thread(open, path, 'rb')
+    try:
+        for start, end, prefix in ranges:
+            if prefix:
+                yield prefix
+            await asyncio.to_thread(handle.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(handle.read, min(RANGE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+            if prefix:
+                yield b'\r\n'
+    finally:
+        handle.close()
+    if closing:
+        yield closing
+
+
+def _sendfile_response(name, path, content_type):
+    mode = settings.DOCUMENT_SENDFILE
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        # nginx: an ``internal`` location aliasing MEDIA_ROOT
+        response['X-Accel-Redirect'] = settings.DOCUMENT_SENDFILE_PREFIX.rstrip('/') + '/' + quote(name)
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = path
+    else:
+        raise ValueError(f"Unknown DOCUMENT_SENDFILE mode: {mode!r}")
+    return response
+
+
+def file_response(request, name, path, *, etag, last_modified=None, filename=None, content_type='application/pdf',
+                  asynchronous=False):
+    """Serve the stored file ``name`` (at ``path``) honouring validators and ``Range``."""
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+
+    if settings.DOCUMENT_SENDFILE:
+        # Django only authorizes; the proxy serves the bytes (and the ranges)
+        response = _sendfile_response(name, path, content_type)
+    else:
+        size = os.path.getsize(path)
+        ranges = None
+        try:
+            if if_range_matches(request, etag, last_modified):
+                ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        read_ranges = _aread_ranges if asynchronous else _read_ranges
+        if ranges is None and asynchronous:
+            response = StreamingHttpResponse(read_ranges(path, [(0, size - 1, None)]), content_type=content_type)
+            response['Content-Length'] = str(size)
+        elif ranges is None:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            response = StreamingHttpResponse(
+                read_ranges(path, [(start, end, None)]), status=206, content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            boundary = uuid.uuid4().hex
+            parts = [
+                (start, end, (
+                    f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+                    f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+                ).encode('ascii'))
+                for start, end in ranges
+            ]
+            closing = f'--{boundary}--\r\n'.encode('ascii')
+            length = sum(len(prefix) + end - start + 1 + 2 for start, end, prefix in parts) + len(closing)
+            response = StreamingHttpResponse(
+                read_ranges(path, parts, closing), status=206,
+                content_type=f'multipart/byteranges; boundary={boundary}',
+            )
+            response['Content-Length'] = str(length)
+
+    response['Accept-Ranges'] = 'bytes'
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    set_validators(response, etag, last_modified)
+    return response
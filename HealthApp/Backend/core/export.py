@@ -0,0 +1,44 @@
+"""Streaming NDJSON export of patient and clinician profiles.
+
+Rows are read with ``.values().iterator(chunk_size=...)`` so only one chunk
+is held in memory at a time, and each record has the same shape as the
+Patient/ClinicianSerializer output.
+"""
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Patient, Clinician
+from .serializers import PatientSerializer, ClinicianSerializer
+from .fast_serializers import ValuesSerializer
+
+EXPORTS = {
+    'patients': (Patient, 'patient_id', ValuesSerializer(PatientSerializer)),
+    'clinicians': (Clinician, 'clinician_id', ValuesSerializer(ClinicianSerializer)),
+}
+
+
+def default_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def iter_records(kind, chunk_size=None):
+    """Yield one serializer-shaped dict per row of ``kind``."""
+    model, pk_field, serializer = EXPORTS[kind]
+    rows = serializer.values(model.objects.order_by(pk_field))
+    build = serializer.row_builder()
+    for row in rows.iterator(chunk_size=chunk_size or default_chunk_size()):
+        yield build(row)
+
+
+def iter_ndjson(kind, chunk_size=None):
+    """Yield NDJSON text, one block of lines per fetched chunk."""
+    chunk_size = chunk_size or default_chunk_size()
+    encode = JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    lines = []
+    for record in iter_records(kind, chunk_size):
+        lines.append(encode(record))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,110 @@
+"""Read-only serialization straight from ``.values()`` rows.
+
+``ValuesSerializer`` inspects a ModelSerializer class once and compiles a plan
+of (output name, values() key, converter) entries. Serializing a batch binds
+the plan into a row builder (resolving the active timezone once instead of
+per datetime) and then does one dict build per row, which yields exactly what
+``ModelSerializer(instance).data`` would, without model instances or
+per-row field introspection.
+
+Supported fields: plain model fields, nested (non-many) ModelSerializers and
+primary-key related fields. Anything else raises ``TypeError`` up front.
+"""
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+
+
+def _identity(value):
+    return value
+
+
+def _bind_datetime(field):
+    """Fast equivalent of ``DateTimeField.to_representation`` for ISO output."""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None or output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+    slow = field.to_representation
+
+    def convert(value):
+        if isinstance(value, str) or not timezone.is_aware(value):
+            return slow(value)
+        text = value.astimezone(field_timezone).isoformat()
+        if text.endswith('+00:00'):
+            text = text[:-6] + 'Z'
+        return text
+    return convert
+
+
+class ValuesSerializer:
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.plan, self.keys = self._compile(serializer_class(), prefix='')
+
+    def _compile(self, serializer, prefix):
+        plan, keys = [], []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*':
+                raise TypeError(f"{type(serializer).__name__}.{name}: source='*' is not supported")
+            key = prefix + '__'.join(field.source_attrs)
+            if isinstance(field, serializers.ListSerializer):
+                raise TypeError(f"{type(serializer).__name__}.{name}: many=True is not supported")
+            if isinstance(field, serializers.BaseSerializer):
+                subplan, subkeys = self._compile(field, key + '__')
+                # the FK column itself tells a null relation from an empty one
+                plan.append((name, key, subplan))
+                keys.append(key)
+                keys.extend(subkeys)
+            elif isinstance(field, PrimaryKeyRelatedField):
+                plan.append((name, key, _identity))
+                keys.append(key)
+            elif isinstance(field, (serializers.SerializerMethodField, serializers.RelatedField)):
+                raise TypeError(f"{type(serializer).__name__}.{name}: {type(field).__name__} is not supported")
+            else:
+                plan.append((name, key, field))
+                keys.append(key)
+        return plan, keys
+
+    def values(self, queryset, *extra):
+        """``queryset.values()`` with every column the plan needs (plus ``extra``)."""
+        return queryset.values(*self.keys, *extra)
+
+    def _bind(self, plan):
+        steps = []
+        for name, key, target in plan:
+            if isinstance(target, list):
+                steps.append((name, key, self._bind(target), True))
+            elif isinstance(target, serializers.DateTimeField):
+                steps.append((name, key, _bind_datetime(target), False))
+            elif isinstance(target, serializers.Field):
+                steps.append((name, key, target.to_representation, False))
+            else:
+                steps.append((name, key, target, False))
+
+        def build(row):
+            ret = {}
+            for name, key, convert, nested in steps:
+                value = row[key]
+                if value is None:
+                    ret[name] = None
+                elif nested:
+                    ret[name] = convert(row)
+                else:
+                    ret[name] = convert(value)
+            return ret
+        return build
+
+    def row_builder(self):
+        """Return a ``row -> dict`` function bound to the current timezone."""
+        return self._bind(self.plan)
+
+    def to_representation(self, row):
+        return self.row_builder()(row)
+
+    def many(self, rows):
+        build = self.row_builder()
+        return [build(row) for row in rows]
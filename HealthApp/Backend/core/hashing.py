@@ -0,0 +1,119 @@
+"""Password hashing and verification off the request thread.
+
+PBKDF2 costs hundreds of milliseconds of CPU per call, and under the GIL a burst
+of logins would starve every other request in the process. ``hash_password``
+and ``verify_password`` run the work in a process pool of
+``PASSWORD_HASH_WORKERS`` processes (0 hashes inline) and only wait for the
+result on the request thread.
+
+At most ``PASSWORD_HASH_MAX_PENDING`` operations may be queued or running per
+web process; a caller that cannot get a slot within
+``PASSWORD_HASH_QUEUE_TIMEOUT`` seconds gets ``HashingBusy``, rendered by DRF
+as 503 with ``Retry-After``, instead of queueing without bound.
+
+Pool processes import this module before Django is set up, so it must not
+import models (the login backend lives in ``core.backends``).
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+_lock = threading.Lock()
+_pool = None
+_slots = None
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many sign-ins in progress, please retry shortly.'
+    default_code = 'hashing_busy'
+
+    def __init__(self, detail=None, code=None):
+        super().__init__(detail, code)
+        # DRF's exception handler turns ``wait`` into a Retry-After header
+        self.wait = settings.PASSWORD_HASH_RETRY_AFTER
+
+
+def _init_worker():
+    # spawned interpreters start without Django configured
+    import django
+    django.setup()
+
+
+def _verify(password, encoded):
+    """``(valid, must_update)`` for ``password`` against the stored hash."""
+    valid = check_password(password, encoded)
+    return valid, valid and identify_hasher(encoded).must_update(encoded)
+
+
+def process_pool(workers):
+    """A pool of ``workers`` processes able to run the hashers."""
+    # spawn, not fork: forking a threaded web process can deadlock the child
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+    )
+
+
+def _executor():
+    global _pool, _slots
+    with _lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_MAX_PENDING)
+        if _pool is None and settings.PASSWORD_HASH_WORKERS > 0:
+            _pool = process_pool(settings.PASSWORD_HASH_WORKERS)
+        return _pool, _slots
+
+
+def _reset_pool(broken):
+    global _pool
+    with _lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(fn, *args):
+    pool, slots = _executor()
+    if not slots.acquire(timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT):
+        raise HashingBusy()
+    try:
+        if pool is None:
+            return fn(*args)
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # a worker died (OOM killer, ...): start a fresh pool next time
+            _reset_pool(pool)
+            return fn(*args)
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    """``make_password(password)``, computed in the hashing pool."""
+    return _run(make_password, password)
+
+
+def verify_password(user, password):
+    """Whether ``password`` is ``user``'s; upgrades an outdated hash in place."""
+    valid, must_update = _run(_verify, password, user.password)
+    if must_update:
+        user.password = hash_password(password)
+        user.save(update_fields=['password'])
+    return valid
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
@@ -0,0 +1,117 @@
+"""Database-backed background job queue.
+
+Jobs are rows in ``core_job``; no broker is involved. Code enqueues work with
+``enqueue``/``enqueue_many`` (inside its own transaction, so a job exists
+exactly when the change that needs it was committed), and ``run_worker``
+processes drain the queue with ``work``. A job is claimed with a conditional
+UPDATE, so several workers never run the same one; failures are retried with
+exponential backoff up to ``JOB_MAX_ATTEMPTS``, and jobs whose worker died
+are handed out again after ``JOB_LOCK_TIMEOUT``. Successful jobs are deleted.
+
+Handlers are plain functions registered with ``@job_handler(kind)`` and called
+with the job's payload as keyword arguments (see ``core.tasks``).
+"""
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+HANDLERS = {}
+
+
+def job_handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, **payload):
+    return Job.objects.create(kind=kind, payload=payload)
+
+
+def enqueue_many(kind, payloads):
+    return Job.objects.bulk_create([Job(kind=kind, payload=payload) for payload in payloads])
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def requeue_stale():
+    """Return jobs locked by a worker that stopped responding to the queue."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.PENDING, locked_by='', locked_at=None,
+    )
+
+
+def claim(worker, limit=1):
+    """Lock up to ``limit`` due jobs for ``worker`` and return them."""
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.PENDING, run_after__lte=now)
+    ids = list(due.order_by('run_after', 'id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    # only rows still pending are taken; a concurrent worker gets the rest
+    due.filter(pk__in=ids).update(
+        status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+    )
+    return list(Job.objects.filter(pk__in=ids, status=Job.RUNNING, locked_by=worker, locked_at=now))
+
+
+def run(job):
+    """Run a claimed job; True on success."""
+    try:
+        handler = HANDLERS.get(job.kind)
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind {job.kind!r}")
+        handler(**job.payload)
+    except Exception:
+        _failed(job, traceback.format_exc())
+        return False
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).delete()
+    return True
+
+
+def _failed(job, error):
+    if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+        changes = {'status': Job.FAILED}
+    else:
+        delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        changes = {'status': Job.PENDING, 'run_after': timezone.now() + timedelta(seconds=delay)}
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        locked_by='', locked_at=None, last_error=error[-10000:], **changes,
+    )
+
+
+def work(worker=None, batch=1, once=False, poll_interval=1.0, should_stop=lambda: False):
+    """Process jobs until ``should_stop()`` (or, with ``once``, the queue is empty).
+
+    Returns ``(succeeded, failed)`` counts.
+    """
+    from . import tasks  # noqa: F401  (registers the handlers)
+
+    worker = worker or worker_name()
+    succeeded = failed = 0
+    while not should_stop():
+        requeue_stale()
+        jobs = claim(worker, batch)
+        if not jobs:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        for job in jobs:
+            if run(job):
+                succeeded += 1
+            else:
+                failed += 1
+    return succeeded, failed
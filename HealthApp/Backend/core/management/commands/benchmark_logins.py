@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from core import hashing
+from core.models import User
+
+PASSWORD = 'Bench-Passw0rd!'
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login throughput under concurrency, and the latency a cheap "
+        "authenticated endpoint (/api/me/) sees meanwhile, with passwords "
+        "checked on the request thread and in the hashing pool. Seeds throwaway "
+        "users and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=16, help="Threads logging in at once.")
+        parser.add_argument('--logins', type=int, default=200, help="Total logins per mode.")
+        parser.add_argument('--workers', type=int, default=settings.PASSWORD_HASH_WORKERS,
+                            help="Hashing pool size for the pooled run.")
+
+    def handle(self, *args, **options):
+        users = self._seed(options['concurrency'])
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                token = Client().post(
+                    '/api/login/', {'username': users[0], 'password': PASSWORD}, content_type='application/json',
+                ).json()['access']
+                for label, workers in (('inline', 0), (f'pool({options["workers"]})', options['workers'])):
+                    with override_settings(PASSWORD_HASH_WORKERS=workers):
+                        hashing.shutdown()
+                        self._run(label, users, token, options)
+                        hashing.shutdown()
+        finally:
+            User.objects.filter(username__in=users).delete()
+
+    def _seed(self, count):
+        encoded = hashing.hash_password(PASSWORD)
+        names = [f'benchlogin_{os.getpid()}_{i}' for i in range(count)]
+        User.objects.bulk_create(User(username=name, first_name='Bench', last_name='Login', password=encoded)
+                                 for name in names)
+        return names
+
+    def _run(self, label, users, token, options):
+        pending = iter(range(options['logins']))
+        pending_lock = threading.Lock()
+        logins, statuses, canary = [], {}, []
+        done = threading.Event()
+
+        def login_worker(username):
+            client = Client()
+            while True:
+                with pending_lock:
+                    if next(pending, None) is None:
+                        return
+                started = time.perf_counter()
+                response = client.post('/api/login/', {'username': username, 'password': PASSWORD},
+                                       content_type='application/json')
+                logins.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        def canary_worker():
+            client = Client(headers={'Authorization': f'Bearer {token}'})
+            while not done.is_set():
+                started = time.perf_counter()
+                client.get('/api/me/')
+                canary.append(time.perf_counter() - started)
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=login_worker, args=(users[i % len(users)],))
+                   for i in range(options['concurrency'])]
+        probe = threading.Thread(target=canary_worker)
+        started = time.perf_counter()
+        probe.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        probe.join()
+
+        def pct(values, p):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else float('nan')
+
+        self.stdout.write(
+            f"{label:<10} logins={len(logins)} in {elapsed:.2f}s ({len(logins) / elapsed:6.1f}/s) "
+            f"statuses={dict(sorted(statuses.items()))} "
+            f"login p50={pct(logins, 0.5):.0f}ms p95={pct(logins, 0.95):.0f}ms | "
+            f"/api/me/ p50={pct(canary, 0.5):.1f}ms p95={pct(canary, 0.95):.1f}ms"
+        )
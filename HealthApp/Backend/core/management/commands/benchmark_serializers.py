@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from core.models import User, Patient, Clinician
+from core.serializers import PatientSerializer, ClinicianSerializer, ClinicianDirectorySerializer
+from core.fast_serializers import ValuesSerializer
+
+CASES = (
+    (Patient, 'patient_id', PatientSerializer),
+    (Clinician, 'clinician_id', ClinicianSerializer),
+    (Clinician, 'clinician_id', ClinicianDirectorySerializer),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ModelSerializer and ValuesSerializer output on synthetic rows: "
+        "checks the rendered JSON is byte-identical and reports timings. "
+        "All rows are created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._seed(options['rows'])
+            try:
+                for model, pk_field, serializer_class in CASES:
+                    self._run(model, pk_field, serializer_class, options['repeat'])
+            finally:
+                transaction.set_rollback(True)
+
+    def _seed(self, count):
+        now = timezone.now()
+        users = User.objects.bulk_create(
+            User(username=f'bench_{i}', first_name=f'First{i}', last_name=f'Last{i}', created_at=now)
+            for i in range(count)
+        )
+        Patient.objects.bulk_create(
+            Patient(user=u, age=i % 90, sex='Female' if i % 2 else 'Male',
+                    health_description=f'synthetic row {i}', created_at=now)
+            for i, u in enumerate(users)
+        )
+        Clinician.objects.bulk_create(
+            Clinician(user=u, age=30 + i % 40, gender='Not disclosed', speciality='Cardiology',
+                      speciality_key='cardiology', created_at=now)
+            for i, u in enumerate(users)
+        )
+
+    def _run(self, model, pk_field, serializer_class, repeat):
+        renderer = JSONRenderer()
+        fast = ValuesSerializer(serializer_class)
+        queryset = model.objects.select_related('user').order_by(pk_field)
+
+        def slow_path():
+            return renderer.render(serializer_class(list(queryset), many=True).data)
+
+        def fast_path():
+            return renderer.render(fast.many(fast.values(queryset)))
+
+        slow_body, slow_time = self._time(slow_path, repeat)
+        fast_body, fast_time = self._time(fast_path, repeat)
+        if slow_body != fast_body:
+            raise CommandError(f"{serializer_class.__name__}: rendered JSON differs")
+        self.stdout.write(
+            f"{serializer_class.__name__:<30} rows={queryset.count():<7} "
+            f"model={slow_time * 1000:8.1f}ms values={fast_time * 1000:8.1f}ms "
+            f"speedup={slow_time / fast_time:5.1f}x  (byte-identical)"
+        )
+
+    def _time(self, fn, repeat):
+        best, body = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return body, best
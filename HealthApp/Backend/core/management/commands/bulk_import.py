@@ -0,0 +1,81 @@
+import csv
+import hashlib
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bulk_import import FORMATS, KINDS, import_records, read_records
+from core.models import ImportRun
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        "Create patients or clinicians (and their users) from a CSV or NDJSON file. "
+        "Fields: first_name, last_name, password (optional; without one the account "
+        "needs a reset), age, and sex + health_description for patients or gender + "
+        "speciality for clinicians. Invalid records are reported and skipped. Rerunning "
+        "the same file resumes after the last committed batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(KINDS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, default=None,
+                            help='Input format (default: from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Records inserted per transaction.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes hashing passwords (0: hash inline).')
+        parser.add_argument('--run-id', default=None,
+                            help='Resume key (default: kind + SHA-256 of the file).')
+        parser.add_argument('--output', '-o', default=None,
+                            help='Append "record,username" for every created account to this CSV.')
+
+    def handle(self, *args, **options):
+        kind, path = options['kind'], options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if not os.path.isfile(path):
+            raise CommandError(f"No such file: {path}")
+
+        key = options['run_id'] or f'{kind}:{_file_sha256(path)}'
+        run, created = ImportRun.objects.get_or_create(key=key, defaults={'kind': kind})
+        if run.kind != kind:
+            raise CommandError(f"Run {key} imported {run.kind}, not {kind}.")
+        if run.finished_at:
+            self.stderr.write(self.style.SUCCESS(
+                f"Already imported ({run.imported} created, {run.skipped} skipped); nothing to do."
+            ))
+            return
+        if not created:
+            self.stderr.write(f"Resuming after record {run.position} ({run.imported} already created)")
+
+        output = open(options['output'], 'a', newline='', encoding='utf-8') if options['output'] else None
+        writer = csv.writer(output) if output else None
+        started = time.perf_counter()
+        imported = skipped = 0
+        try:
+            batches = import_records(kind, read_records(path, fmt), run,
+                                     batch_size=options['batch_size'], workers=options['workers'])
+            for batch in batches:
+                imported += batch.imported
+                skipped += batch.skipped
+                for number, error in batch.errors:
+                    self.stderr.write(self.style.WARNING(f"record {number}: {error}"))
+                if writer:
+                    writer.writerows(batch.usernames)
+                    output.flush()
+                rate = imported / (time.perf_counter() - started)
+                self.stderr.write(f"record {batch.position}: {imported} created, {skipped} skipped ({rate:.0f}/s)")
+        finally:
+            if output:
+                output.close()
+        self.stderr.write(self.style.SUCCESS(f"Imported {imported} {kind}, skipped {skipped}"))
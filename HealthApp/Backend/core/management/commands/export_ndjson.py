@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from core.export import EXPORTS, iter_ndjson
+
+
+class Command(BaseCommand):
+    help = "Stream patients or clinicians as NDJSON (one JSON object per line)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows fetched from the database per round trip.')
+        parser.add_argument('--output', '-o', default='-',
+                            help='Output file path, or - for stdout (default).')
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        chunks = iter_ndjson(kind, options['chunk_size'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            self.stdout.flush()
+            return
+        with open(options['output'], 'w', encoding='utf-8') as out:
+            for chunk in chunks:
+                out.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exported {kind} to {options['output']}"))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from core.media_gc import find_missing, find_orphans, reclaim
+
+
+class Command(BaseCommand):
+    help = ("Report (and with --delete, remove) files under MEDIA_ROOT that no row references, "
+            "and report documents whose file is missing.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true',
+                            help='Remove orphaned files (default: only report them).')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Names/rows checked against the database per query.')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Ignore files modified within this many seconds (in-flight uploads).')
+
+    def handle(self, *args, **options):
+        orphans = reclaimed = orphan_bytes = 0
+        for name, size in find_orphans(options['batch_size'], options['min_age']):
+            orphans += 1
+            orphan_bytes += size
+            if options['delete'] and reclaim(name):
+                reclaimed += 1
+                self.stdout.write(f"deleted\t{name}\t{size}")
+            else:
+                self.stdout.write(f"orphan\t{name}\t{size}")
+
+        missing = 0
+        for document_id, file_path in find_missing(options['batch_size']):
+            missing += 1
+            self.stdout.write(f"missing\t{document_id}\t{file_path}")
+
+        summary = f"{orphans} orphaned file(s), {orphan_bytes} bytes"
+        if options['delete']:
+            summary += f", {reclaimed} deleted"
+        summary += f"; {missing} document(s) missing their file"
+        self.stderr.write(self.style.SUCCESS(summary) if not missing else self.style.WARNING(summary))
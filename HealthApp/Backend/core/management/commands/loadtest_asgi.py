@@ -0,0 +1,144 @@
+import asyncio
+import os
+import statistics
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from core.models import User, Patient, Document
+from core.tokens import ClaimsTokenObtainPairSerializer
+
+HOST = 'loadtest'
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the ASGI application in-process with many concurrent, slow "
+        "clients downloading one document (or listing documents) and report "
+        "latency, threads and peak Python heap. Run it once with "
+        "ASYNC_VIEWS=0 and once with ASYNC_VIEWS=1 to compare the sync and "
+        "async views. Seeds a throwaway patient and deletes it afterwards; its "
+        "stored file is removed by the job worker like any other deletion."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=200, help="Concurrent requests in flight.")
+        parser.add_argument('--size-kb', type=int, default=1024, help="Size of the seeded document.")
+        parser.add_argument('--client-delay', type=float, default=0.005,
+                            help="Seconds each client takes to accept one body chunk (a slow link).")
+        parser.add_argument('--endpoint', choices=('download', 'list'), default='download')
+
+    def handle(self, *args, **options):
+        user, path = self._seed(options['size_kb'], options['endpoint'])
+        token = str(ClaimsTokenObtainPairSerializer.get_token(user).access_token)
+        try:
+            with override_settings(ALLOWED_HOSTS=[HOST]):
+                results = asyncio.run(self._drive(path, token, options['connections'], options['client_delay']))
+        finally:
+            user.delete()
+        self._report(results, options)
+
+    def _seed(self, size_kb, endpoint):
+        user = User.objects.create_user(username=f'loadtest_{os.getpid()}', password=None,
+                                        first_name='Load', last_name='Test')
+        patient = Patient.objects.create(user=user, age=40, sex='Female', health_description='load test')
+        body = b'%PDF-1.4\n' + os.urandom(size_kb * 1024)
+        doc = Document(patient=patient, uploaded_by=user)
+        doc.file.save('loadtest.pdf', ContentFile(body), save=False)
+        doc.save()
+        base = f'/api/patients/{patient.patient_id}/documents/'
+        return user, base if endpoint == 'list' else f'{base}{doc.document_id}/download/'
+
+    async def _drive(self, path, token, connections, client_delay):
+        application = get_asgi_application()
+        stop = asyncio.Event()
+        peak_threads = threading.active_count()
+
+        async def sample_threads():
+            nonlocal peak_threads
+            while not stop.is_set():
+                peak_threads = max(peak_threads, threading.active_count())
+                await asyncio.sleep(0.01)
+
+        async def one(i):
+            started = time.perf_counter()
+            done = asyncio.Event()
+            result = {'status': None, 'ttfb': None, 'bytes': 0}
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+                'query_string': b'', 'root_path': '',
+                'headers': [(b'host', HOST.encode()), (b'authorization', f'Bearer {token}'.encode())],
+                'client': ('127.0.0.1', 10000 + i), 'server': (HOST, 80),
+            }
+            sent_request = False
+
+            async def receive():
+                nonlocal sent_request
+                if not sent_request:
+                    sent_request = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await done.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    result['status'] = message['status']
+                    result['ttfb'] = time.perf_counter() - started
+                elif message['type'] == 'http.response.body':
+                    result['bytes'] += len(message.get('body', b''))
+                    if client_delay:
+                        # what a server's flow control does for a slow reader
+                        await asyncio.sleep(client_delay)
+                    if not message.get('more_body', False):
+                        done.set()
+
+            await application(scope, receive, send)
+            done.set()
+            result['total'] = time.perf_counter() - started
+            return result
+
+        sampler = asyncio.create_task(sample_threads())
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(one(i) for i in range(connections)))
+        finally:
+            elapsed = time.perf_counter() - started
+            _, peak_heap = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stop.set()
+            await sampler
+        return {'results': results, 'elapsed': elapsed, 'peak_threads': peak_threads, 'peak_heap': peak_heap}
+
+    def _report(self, run, options):
+        results = run['results']
+        ok = [r for r in results if r['status'] is not None and r['status'] < 400]
+        ttfb = sorted(r['ttfb'] for r in results if r['ttfb'] is not None)
+        total = sorted(r['total'] for r in results)
+
+        def pct(values, p):
+            return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else float('nan')
+
+        self.stdout.write(
+            f"views={'async' if settings.ASYNC_VIEWS else 'sync'} endpoint={options['endpoint']} "
+            f"connections={options['connections']} ok={len(ok)} errors={len(results) - len(ok)}"
+        )
+        self.stdout.write(
+            f"  wall={run['elapsed']:.2f}s  throughput={len(ok) / run['elapsed']:.1f} req/s  "
+            f"bytes/response={statistics.mean(r['bytes'] for r in results):.0f}"
+        )
+        self.stdout.write(
+            f"  ttfb p50={pct(ttfb, 0.5):.0f}ms p95={pct(ttfb, 0.95):.0f}ms  "
+            f"total p50={pct(total, 0.5):.0f}ms p95={pct(total, 0.95):.0f}ms"
+        )
+        self.stdout.write(
+            f"  peak threads={run['peak_threads']}  peak python heap={run['peak_heap'] / 2 ** 20:.1f}MB "
+            f"({run['peak_heap'] / len(results) / 1024:.0f}KB per connection)"
+        )
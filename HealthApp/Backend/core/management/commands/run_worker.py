@@ -0,0 +1,58 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker_main(options, stop):
+    # may run in a freshly spawned interpreter: configure Django first
+    import django
+    django.setup()
+    from core.jobs import work
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent coordinates shutdown
+    work(batch=options['batch'], once=options['once'],
+         poll_interval=options['poll_interval'], should_stop=stop.is_set)
+
+
+class Command(BaseCommand):
+    help = "Run background jobs (text extraction, ...) from the database queue with a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', '-p', type=int, default=multiprocessing.cpu_count(),
+                            help='Worker processes (default: CPU count).')
+        parser.add_argument('--batch', type=int, default=1,
+                            help='Jobs claimed per round trip by each worker.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is drained instead of polling.')
+
+    def handle(self, *args, **options):
+        if options['processes'] <= 1:
+            from core.jobs import work
+            succeeded, failed = work(batch=options['batch'], once=options['once'],
+                                     poll_interval=options['poll_interval'])
+            self.stderr.write(self.style.SUCCESS(f"{succeeded} job(s) done, {failed} failed"))
+            return
+
+        stop = multiprocessing.Event()
+        # children must open their own database connections
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=_worker_main, args=(options, stop), daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for process in workers:
+            process.start()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        self.stderr.write(f"Started {len(workers)} worker process(es)")
+        try:
+            for process in workers:
+                process.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for process in workers:
+                process.join()
+        self.stderr.write(self.style.SUCCESS("Workers stopped"))
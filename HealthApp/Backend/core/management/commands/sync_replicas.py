@@ -0,0 +1,45 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.replicas import PRIMARY
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database into every replica file listed in "
+        "DATABASE_REPLICAS: a local stand-in for replication, to exercise "
+        "replica routing (and its lag, with --interval) without a database server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Repeat every N seconds instead of copying once.")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured (set DATABASE_REPLICAS).")
+        for alias in [PRIMARY, *settings.DATABASE_REPLICAS]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f"{alias} is not SQLite; replicate it with the database's own tooling.")
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                self._copy(connections[PRIMARY].settings_dict['NAME'], connections[alias].settings_dict['NAME'])
+                self.stdout.write(f"{alias}: synced")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def _copy(self, source_name, target_name):
+        # the backup API gives a consistent snapshot even while the primary is written;
+        # names may be URIs (the test runner's in-memory databases)
+        source = sqlite3.connect(str(source_name), uri=str(source_name).startswith('file:'))
+        target = sqlite3.connect(str(target_name), uri=str(target_name).startswith('file:'))
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
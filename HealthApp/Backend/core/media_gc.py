@@ -0,0 +1,93 @@
+"""Reconcile stored files under ``MEDIA_ROOT`` with the database.
+
+Orphans are files no ``Document``, ``DocumentBlob`` or ``UploadSession`` row
+points at: leftovers of uploads that failed or crashed between writing the
+file and committing the row. Missing files are the opposite: Document rows
+whose file is gone. Both scans stream: directories are read lazily with
+``os.scandir`` and names are checked against the database ``batch_size`` at a
+time, so memory does not grow with the number of files or rows.
+"""
+import os
+import time
+from itertools import islice
+
+from .models import Document, DocumentBlob, UploadSession
+from .storage import document_storage
+
+
+def iter_stored_files(root):
+    """Yield ``(name, DirEntry)`` for every file below ``root``, name relative with '/'."""
+    pending = ['']
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(os.path.join(root, directory)) as entries:
+                for entry in entries:
+                    name = f'{directory}/{entry.name}' if directory else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(name)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield name, entry
+        except FileNotFoundError:
+            continue
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def referenced_names(names):
+    """The subset of stored ``names`` some row points at."""
+    return (
+        set(Document.objects.filter(file_path__in=names).values_list('file_path', flat=True))
+        | set(DocumentBlob.objects.filter(name__in=names).values_list('name', flat=True))
+        | set(UploadSession.objects.filter(temp_name__in=names).values_list('temp_name', flat=True))
+    )
+
+
+def find_orphans(batch_size=1000, min_age=3600):
+    """Yield ``(name, size)`` of unreferenced files last modified over ``min_age`` seconds ago.
+
+    Younger files are skipped: they may belong to an upload still in flight.
+    """
+    root = document_storage().location
+    cutoff = time.time() - min_age
+    for batch in _batched(iter_stored_files(root), batch_size):
+        referenced = referenced_names([name for name, _ in batch])
+        for name, entry in batch:
+            if name in referenced:
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime <= cutoff:
+                yield name, stat.st_size
+
+
+def reclaim(name):
+    """Delete an orphan unless something started referencing it since the scan."""
+    if referenced_names([name]):
+        return False
+    document_storage().delete(name)
+    return True
+
+
+def find_missing(batch_size=1000):
+    """Yield ``(document_id, file_path)`` for Documents whose file is not on disk."""
+    storage = document_storage()
+    last_id = 0
+    while True:
+        rows = list(
+            Document.objects.filter(document_id__gt=last_id)
+            .order_by('document_id')
+            .values_list('document_id', 'file_path')[:batch_size]
+        )
+        if not rows:
+            return
+        for document_id, file_path in rows:
+            if not file_path or not os.path.isfile(storage.path(file_path)):
+                yield document_id, file_path
+        last_id = rows[-1][0]
@@ -0,0 +1,85 @@
+"""Project middleware; each class runs natively under both WSGI and ASGI."""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+from .auth import _decode_bearer
+from .replicas import ais_pinned, allow_replica_reads, is_pinned, pin_to_primary, replica_aliases
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """WhiteNoise that also runs natively under ASGI.
+
+    Stock WhiteNoise is sync-only, which makes Django run every request (and
+    the async views behind it) through a thread. Here only static file hits
+    go to a thread; everything else is awaited straight through.
+    """
+
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
+
+
+def _caller_id(request):
+    payload = _decode_bearer(request)
+    return payload.get('user_id') if payload else None
+
+
+class ReplicaPinningMiddleware:
+    """Let safe requests read from replicas unless the caller wrote recently.
+
+    A request with any other method reads and writes on the primary, and pins
+    the caller's following requests there (see ``core.replicas``).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_aliases():
+            return self.get_response(request)
+        user_id = _caller_id(request)
+        if request.method in SAFE_METHODS:
+            with allow_replica_reads(user_id is None or not is_pinned(user_id)):
+                return self.get_response(request)
+        response = self.get_response(request)
+        if user_id is not None:
+            pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        if not replica_aliases():
+            return await self.get_response(request)
+        user_id = _caller_id(request)
+        if request.method in SAFE_METHODS:
+            with allow_replica_reads(user_id is None or not await ais_pinned(user_id)):
+                return await self.get_response(request)
+        response = await self.get_response(request)
+        if user_id is not None:
+            await sync_to_async(pin_to_primary)(user_id)
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='authz_epoch',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_user_authz_epoch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['created_at', 'patient_id'], name='patient_created_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+def create_patient_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE core_patient_fts USING fts5("
+        "first_name, last_name, health_description, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO core_patient_fts (rowid, first_name, last_name, health_description) "
+        "SELECT p.patient_id, u.first_name, u.last_name, COALESCE(p.health_description, '') "
+        "FROM core_patient p JOIN \"Users\" u ON u.id = p.user_id"
+    )
+
+
+def drop_patient_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS core_patient_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_patient_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['sex', 'age'], name='patient_sex_age_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['age'], name='patient_age_idx'),
+        ),
+        migrations.RunPython(create_patient_fts, drop_patient_fts),
+    ]
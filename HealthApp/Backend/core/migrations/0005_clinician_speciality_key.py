@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+def backfill_speciality_key(apps, schema_editor):
+    # inlined copy of core.models.normalize_speciality
+    Clinician = apps.get_model('core', 'Clinician')
+    for clinician in Clinician.objects.only('clinician_id', 'speciality').iterator():
+        key = ' '.join((clinician.speciality or '').split()).casefold()
+        Clinician.objects.filter(pk=clinician.pk).update(speciality_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_patient_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clinician',
+            name='speciality_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_speciality_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='clinician',
+            index=models.Index(fields=['speciality_key', 'clinician_id'], name='clinician_speciality_idx'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_document_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    # external-content index over core_documenttext, kept in sync by triggers
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE core_document_fts USING fts5("
+        "content, content='core_documenttext', content_rowid='document_id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER core_documenttext_ai AFTER INSERT ON core_documenttext BEGIN "
+        "INSERT INTO core_document_fts (rowid, content) VALUES (new.document_id, new.content); END"
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER core_documenttext_ad AFTER DELETE ON core_documenttext BEGIN "
+        "INSERT INTO core_document_fts (core_document_fts, rowid, content) "
+        "VALUES ('delete', old.document_id, old.content); END"
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER core_documenttext_au AFTER UPDATE ON core_documenttext BEGIN "
+        "INSERT INTO core_document_fts (core_document_fts, rowid, content) "
+        "VALUES ('delete', old.document_id, old.content); "
+        "INSERT INTO core_document_fts (rowid, content) VALUES (new.document_id, new.content); END"
+    )
+
+
+def drop_document_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('core_documenttext_ai', 'core_documenttext_ad', 'core_documenttext_au'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    schema_editor.execute("DROP TABLE IF EXISTS core_document_fts")
+
+
+def enqueue_existing_documents(apps, schema_editor):
+    Document = apps.get_model('core', 'Document')
+    Job = apps.get_model('core', 'Job')
+    ids = Document.objects.values_list('document_id', flat=True).iterator()
+    Job.objects.bulk_create(
+        (Job(kind='extract_document_text', payload={'document_id': document_id}) for document_id in ids),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='text_extracted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='text', serialize=False, to='core.document')),
+                ('content', models.TextField(blank=True, default='')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_texts', to='core.patient')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=64)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, default='', max_length=64)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after', 'id'], name='job_status_run_after_idx')],
+            },
+        ),
+        migrations.RunPython(create_document_fts, drop_document_fts),
+        migrations.RunPython(enqueue_existing_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_document_changes(apps, schema_editor):
+    # existing documents enter the feed as creations, numbered from 1
+    Patient = apps.get_model('core', 'Patient')
+    Document = apps.get_model('core', 'Document')
+    DocumentChange = apps.get_model('core', 'DocumentChange')
+    for patient in Patient.objects.filter(documents__isnull=False).distinct().iterator():
+        ids = list(
+            Document.objects.filter(patient_id=patient.patient_id)
+            .order_by('uploaded_time', 'document_id')
+            .values_list('document_id', flat=True)
+        )
+        DocumentChange.objects.bulk_create([
+            DocumentChange(patient_id=patient.patient_id, seq=seq, document_id=document_id, kind='created')
+            for seq, document_id in enumerate(ids, start=1)
+        ])
+        if patient.documents_version < len(ids):
+            Patient.objects.filter(pk=patient.pk).update(documents_version=len(ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_document_text_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient_id', models.IntegerField()),
+                ('seq', models.PositiveIntegerField()),
+                ('document_id', models.IntegerField()),
+                ('kind', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=10)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['patient', 'uploaded_time'], name='document_patient_uploaded_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='documentchange',
+            constraint=models.UniqueConstraint(fields=('patient_id', 'seq'), name='document_change_patient_seq_uniq'),
+        ),
+        migrations.RunPython(backfill_document_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+import os
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_blob_references(apps, schema_editor):
+    # Count one reference per Document stored under a blob name. Documents
+    # uploaded before content addressing own their file outright (their
+    # sha256 is set but the name is not a blob name) and need no row.
+    from core.storage import blob_name, document_storage
+
+    Document = apps.get_model('core', 'Document')
+    DocumentBlob = apps.get_model('core', 'DocumentBlob')
+    counts = (
+        Document.objects.exclude(sha256='').filter(file_path__startswith='blobs/')
+        .values('sha256', 'file_path').annotate(refs=Count('document_id'))
+    )
+    storage = document_storage()
+    for row in counts.iterator():
+        name = blob_name(row['sha256'])
+        if row['file_path'] != name:
+            continue
+        path = storage.path(name)
+        DocumentBlob.objects.update_or_create(
+            sha256=row['sha256'],
+            defaults={
+                'name': name,
+                'size': os.path.getsize(path) if os.path.exists(path) else 0,
+                'ref_count': row['refs'],
+            },
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_import_runs'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_blob_references, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,6 @@
 import os
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.hashers import make_password, check_password
 from django.utils import timezone
 from django.conf import settings
@@ -8,6 +8,8 @@ from django.core.exceptions import ValidationError
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
 
+from .storage import document_storage, digest_of, file_digest
+
 
 class UserManager(BaseUserManager):
     def create_user(self, username, password=None, **extra_fields):
@@ -33,7 +35,11 @@ class User(AbstractBaseUser):
     last_name = models.CharField(max_length=150, db_column="last_name")
     password = models.CharField(max_length=128, db_column="password_hash")
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # Bumped whenever the user's roles change; access tokens signed with an
+    # older epoch are rejected (see core.auth.get_request_principal).
+    authz_epoch = models.PositiveIntegerField(default=0)
 
     USERNAME_FIELD = "username"
     REQUIRED_FIELDS = []
@@ -74,6 +80,25 @@ class Patient(models.Model):
     age = models.IntegerField()
     sex = models.CharField(max_length=10)
     health_description = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bumped (via queryset update, so updated_at is untouched) whenever a
+    # document is added or removed; validator for the documents list.
+    documents_version = models.PositiveIntegerField(default=0)
+    documents_updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # keyset pagination order for GetPatients
+            models.Index(fields=['created_at', 'patient_id'], name='patient_created_at_id_idx'),
+            # PatientSearch filters
+            models.Index(fields=['sex', 'age'], name='patient_sex_age_idx'),
+            models.Index(fields=['age'], name='patient_age_idx'),
+        ]
+
+
+def normalize_speciality(value):
+    """Directory key for a speciality: trimmed, single-spaced, case-folded."""
+    return ' '.join((value or '').split()).casefold()
 
 
 class Clinician(models.Model):
@@ -83,6 +108,21 @@ class Clinician(models.Model):
     age = models.IntegerField()
     gender = models.CharField(max_length=10)
     speciality = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True)
+    # normalized copy of speciality used for directory filtering (auto set on save)
+    speciality_key = models.CharField(max_length=255, editable=False, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['speciality_key', 'clinician_id'], name='clinician_speciality_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.speciality_key = normalize_speciality(self.speciality)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'speciality' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'speciality_key'}
+        super().save(*args, **kwargs)
 
 
 # Document/ File related Model logic
@@ -119,18 +159,156 @@ class Document(models.Model):
 
     uploaded_by = models.ForeignKey('User', on_delete=models.SET_NULL, null=True, blank=True, related_name='uploaded_documents')
 
-    # Actual stored file
-    file = models.FileField(upload_to=patient_document_upload_to, validators=[validate_pdf])
+    # Actual stored file (content-addressed: identical uploads share one blob)
+    file = models.FileField(upload_to=patient_document_upload_to, storage=document_storage, validators=[validate_pdf])
 
     # Redundant path column per spec (auto set on save)
     file_path = models.CharField(max_length=500, editable=False)
 
+    # SHA-256 of the file contents (hex), computed while the upload streams in
+    sha256 = models.CharField(max_length=64, blank=True, default='', editable=False, db_index=True)
+
+    # Filled in by the background text extraction job (core.tasks)
+    page_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    text_extracted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # per-patient document lists, newest first (GetDocuments)
+            models.Index(fields=['patient', 'uploaded_time'], name='document_patient_uploaded_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)  # ensure file saved first
-        if self.file and self.file.name != self.file_path:
-            # update stored path (relative to MEDIA_ROOT)
-            type(self).objects.filter(pk=self.pk).update(file_path=self.file.name)
+        if self.file and not self.sha256:
+            # plain (non-streamed) upload: storage names it by this digest
+            if self.file._committed:
+                self.sha256 = digest_of(self.file.name) or ''
+            else:
+                self.sha256 = file_digest(self.file)
+        if self.file and self.file._committed:
+            # already in storage (e.g. streamed by PdfStreamUploadHandler):
+            # the path is known before the INSERT, no follow-up UPDATE needed
             self.file_path = self.file.name
+        # storing a new file references its blob; the row commits with it
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)  # ensure file saved first
+            if self.file and self.file.name != self.file_path:
+                # update stored path (relative to MEDIA_ROOT)
+                type(self).objects.filter(pk=self.pk).update(file_path=self.file.name)
+                self.file_path = self.file.name
+
+    def __str__(self):
+        return f"Doc {self.document_id} for Patient {self.patient_id}"
+
+
+class DocumentBlob(models.Model):
+    """One stored file in content-addressed storage, shared by Documents with this digest."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=500)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Blob {self.sha256} ({self.ref_count} refs)"
+
+
+class UploadSession(models.Model):
+    """A resumable document upload: bytes ``[0, offset)`` are stored in ``temp_name``."""
+    upload_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    patient = models.ForeignKey('Patient', on_delete=models.CASCADE, related_name='upload_sessions')
+    created_by = models.ForeignKey('User', on_delete=models.CASCADE, related_name='upload_sessions')
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    temp_name = models.CharField(max_length=500)
+    # the PUT currently writing at ``offset`` (see core.resumable.write_chunk)
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Upload {self.upload_id} ({self.offset}/{self.size})"
+
+
+class DocumentChange(models.Model):
+    """One entry in a patient's document change feed (see core.changes).
+
+    ``seq`` is the patient's ``documents_version`` after the change. Plain
+    integer columns rather than foreign keys: a tombstone outlives its
+    document.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    KIND_CHOICES = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')]
+
+    patient_id = models.IntegerField()
+    seq = models.PositiveIntegerField()
+    document_id = models.IntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient_id', 'seq'], name='document_change_patient_seq_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Change {self.patient_id}#{self.seq} {self.kind} Doc {self.document_id}"
+
+
+class DocumentText(models.Model):
+    """Text extracted from a document's PDF; indexed by ``core_document_fts``."""
+    document = models.OneToOneField('Document', on_delete=models.CASCADE, primary_key=True, related_name='text')
+    patient = models.ForeignKey('Patient', on_delete=models.CASCADE, related_name='document_texts')
+    content = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"Text of Doc {self.document_id}"
+
+
+class Job(models.Model):
+    """A unit of background work, run by the ``run_worker`` command (see core.jobs)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # what the worker polls: pending jobs that are due, oldest first
+            models.Index(fields=['status', 'run_after', 'id'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} {self.kind} ({self.status})"
+
+
+class ImportRun(models.Model):
+    """Progress of a ``bulk_import`` run, advanced in each batch's transaction.
+
+    ``position`` counts input records consumed (imported or skipped), so a
+    rerun with the same ``key`` resumes right after the last committed batch.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    kind = models.CharField(max_length=20)
+    position = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
-        return f"Doc {self.document_id} for Patient {self.patient_id}"
\ No newline at end of file
+        return f"Import {self.key} at {self.position}"
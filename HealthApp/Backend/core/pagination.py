@@ -0,0 +1,151 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+
+
+class InvalidCursor(ParseError):
+    default_detail = 'Invalid cursor.'
+
+
+def _encode_cursor(values, direction):
+    # isoformat() keeps full microsecond precision, which keyset comparisons need
+    values = [v.isoformat() if hasattr(v, 'isoformat') else v for v in values]
+    raw = json.dumps({'v': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return data['v'], data['d']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor()
+
+
+def _query_params(request):
+    # DRF requests and the plain HttpRequests of the async views
+    return getattr(request, 'query_params', request.GET)
+
+
+class KeysetPaginator:
+    """Cursor pagination over a unique, ascending tuple of model fields.
+
+    Pages are fetched with ``WHERE (f1, f2, ...) > cursor ORDER BY f1, f2, ...
+    LIMIT n``, so the cost of a page does not grow with its depth as long as
+    an index covers ``fields``. Cursors are opaque to clients.
+    """
+
+    def __init__(self, fields, page_size=None, max_page_size=None):
+        self.fields = tuple(fields)
+        self.page_size = page_size or getattr(settings, 'API_PAGE_SIZE', 50)
+        self.max_page_size = max_page_size or getattr(settings, 'API_MAX_PAGE_SIZE', 200)
+
+    def get_page_size(self, request):
+        try:
+            size = int(_query_params(request).get('page_size', self.page_size))
+        except (TypeError, ValueError):
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _after(self, values, strict_op):
+        """Row-value comparison ``(fields) <op> (values)`` as OR-ed Q terms.
+
+        The OR alone cannot bound an index range, so it is ANDed with the
+        implied non-strict bound on the first field (``f1 >= v1`` for ``gt``),
+        which lets the index on ``fields`` start the scan at the cursor.
+        """
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            term = Q(**{f'{field}__{strict_op}': values[i]})
+            for prev_field, prev_value in zip(self.fields[:i], values[:i]):
+                term &= Q(**{prev_field: prev_value})
+            condition |= term
+        return Q(**{f'{self.fields[0]}__{strict_op}e': values[0]}) & condition
+
+    def _cursor_values(self, queryset, raw_values):
+        if not isinstance(raw_values, list) or len(raw_values) != len(self.fields):
+            raise InvalidCursor()
+        opts = queryset.model._meta
+        try:
+            return [opts.get_field(f).to_python(v) for f, v in zip(self.fields, raw_values)]
+        except Exception:
+            raise InvalidCursor()
+
+    def _row_values(self, row):
+        # rows are model instances, or dicts when paginating a .values() queryset
+        if isinstance(row, dict):
+            return [row[f] for f in self.fields]
+        return [getattr(row, f) for f in self.fields]
+
+    def page(self, queryset, request, serializer):
+        """Paginate and serialize: ``{'results', 'next', 'previous'}``.
+
+        ``serializer`` is either a DRF serializer class, applied to model
+        instances, or a ``ValuesSerializer``, in which case the page is read
+        as plain ``.values()`` rows.
+        """
+        queryset = self._page_queryset(queryset, serializer)
+        rows, next_cursor, previous_cursor = self.paginate(queryset, request)
+        return self._page_data(rows, next_cursor, previous_cursor, request, serializer)
+
+    async def apage(self, queryset, request, serializer):
+        """``page`` for async views: the page is fetched with the async ORM."""
+        queryset = self._page_queryset(queryset, serializer)
+        rows, next_cursor, previous_cursor = await self.apaginate(queryset, request)
+        return self._page_data(rows, next_cursor, previous_cursor, request, serializer)
+
+    def _page_queryset(self, queryset, serializer):
+        if hasattr(serializer, 'values'):
+            extra = [f for f in self.fields if f not in serializer.keys]
+            queryset = serializer.values(queryset, *extra)
+        return queryset
+
+    def _page_data(self, rows, next_cursor, previous_cursor, request, serializer):
+        results = serializer.many(rows) if hasattr(serializer, 'values') else serializer(rows, many=True).data
+        return {'results': results, 'next': next_cursor, 'previous': previous_cursor}
+
+    def paginate(self, queryset, request):
+        """Return ``(rows, next_cursor, previous_cursor)`` for this request."""
+        queryset, size, cursor, direction = self._window(queryset, request)
+        return self._cursors(list(queryset[:size + 1]), size, cursor, direction)
+
+    async def apaginate(self, queryset, request):
+        queryset, size, cursor, direction = self._window(queryset, request)
+        return self._cursors([row async for row in queryset[:size + 1]], size, cursor, direction)
+
+    def _window(self, queryset, request):
+        """Filter and order ``queryset`` for the requested page."""
+        size = self.get_page_size(request)
+        cursor = _query_params(request).get('cursor')
+        direction = 'next'
+        if cursor:
+            raw_values, direction = _decode_cursor(cursor)
+            if direction not in ('next', 'prev'):
+                raise InvalidCursor()
+            values = self._cursor_values(queryset, raw_values)
+            op = 'gt' if direction == 'next' else 'lt'
+            queryset = queryset.filter(self._after(values, op))
+
+        if direction == 'next':
+            queryset = queryset.order_by(*self.fields)
+        else:
+            queryset = queryset.order_by(*(f'-{f}' for f in self.fields))
+        return queryset, size, cursor, direction
+
+    def _cursors(self, rows, size, cursor, direction):
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if direction == 'prev':
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or direction == 'prev':
+                next_cursor = _encode_cursor(self._row_values(rows[-1]), 'next')
+            if cursor and (has_more or direction == 'next'):
+                previous_cursor = _encode_cursor(self._row_values(rows[0]), 'prev')
+        return rows, next_cursor, previous_cursor
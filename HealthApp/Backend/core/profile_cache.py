@@ -0,0 +1,155 @@
+"""Read-through cache for hot profile lookups, keyed by id.
+
+Entries are filled on first read and dropped by the signal handlers in
+``core.signals`` (plus ``bump_authz_epoch`` for its queryset update), so a
+cached profile is never older than the last save. ``PROFILE_CACHE_TTL``
+bounds staleness for writes that bypass signals.
+
+Authz epochs are cached for ``AUTHZ_EPOCH_CACHE_TTL`` instead, which is 0
+(read on every request) unless the cache is shared: a per-process cache
+never sees another process's ``bump_authz_epoch``.
+
+Misses load from the primary database even when replicas are configured, so
+replication lag is never cached for a whole TTL.
+
+The ``aget_*`` variants serve the async views (``core.views_async``): the
+cache round trip is awaited and only a miss runs the ORM load in a thread.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import User, Patient, Clinician
+from .replicas import use_primary
+from .serializers import UserSerializer, PatientSerializer, ClinicianSerializer
+
+_MISSING = object()
+
+
+def _ttl():
+    return getattr(settings, 'PROFILE_CACHE_TTL', 300)
+
+
+def _epoch_ttl():
+    return getattr(settings, 'AUTHZ_EPOCH_CACHE_TTL', 0)
+
+
+def _read_through(key, load, ttl=None):
+    ttl = _ttl() if ttl is None else ttl
+    if not ttl:
+        with use_primary():
+            return load()
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        with use_primary():
+            value = load()
+        cache.set(key, value, ttl)
+    return value
+
+
+async def _aread_through(key, load, ttl=None):
+    ttl = _ttl() if ttl is None else ttl
+    if not ttl:
+        with use_primary():
+            return await sync_to_async(load)()
+    value = await cache.aget(key, _MISSING)
+    if value is _MISSING:
+        with use_primary():
+            value = await sync_to_async(load)()
+        await cache.aset(key, value, ttl)
+    return value
+
+
+def patient_key(patient_id):
+    return f'core:patient:{patient_id}'
+
+
+def clinician_key(clinician_id):
+    return f'core:clinician:{clinician_id}'
+
+
+def user_key(user_id):
+    return f'core:user:{user_id}'
+
+
+def epoch_key(user_id):
+    return f'core:user-epoch:{user_id}'
+
+
+def _profile_entry(obj, serializer_class):
+    return {
+        'data': dict(serializer_class(obj).data),
+        'user_id': obj.user_id,
+        'versions': (obj.updated_at, obj.user.updated_at),
+    }
+
+
+def _load_patient(patient_id):
+    patient = Patient.objects.select_related('user').filter(patient_id=patient_id).first()
+    return _profile_entry(patient, PatientSerializer) if patient else None
+
+
+def _load_clinician(clinician_id):
+    clinician = Clinician.objects.select_related('user').filter(clinician_id=clinician_id).first()
+    return _profile_entry(clinician, ClinicianSerializer) if clinician else None
+
+
+def _load_epoch(user_id):
+    return User.objects.filter(id=user_id, is_active=True).values_list('authz_epoch', flat=True).first()
+
+
+def get_patient_profile(patient_id):
+    """``{'data', 'user_id', 'versions'}`` for a patient, or None if missing."""
+    return _read_through(patient_key(patient_id), lambda: _load_patient(patient_id))
+
+
+async def aget_patient_profile(patient_id):
+    return await _aread_through(patient_key(patient_id), lambda: _load_patient(patient_id))
+
+
+def get_clinician_profile(clinician_id):
+    """``{'data', 'user_id', 'versions'}`` for a clinician, or None if missing."""
+    return _read_through(clinician_key(clinician_id), lambda: _load_clinician(clinician_id))
+
+
+async def aget_clinician_profile(clinician_id):
+    return await _aread_through(clinician_key(clinician_id), lambda: _load_clinician(clinician_id))
+
+
+def get_user_profile(user_id):
+    """UserSerializer data for a user, or None if missing."""
+    def load():
+        user = User.objects.filter(id=user_id).first()
+        return dict(UserSerializer(user).data) if user else None
+    return _read_through(user_key(user_id), load)
+
+
+def get_authz_epoch(user_id):
+    """Current authz epoch of an active user, or None if the user is gone."""
+    return _read_through(epoch_key(user_id), lambda: _load_epoch(user_id), _epoch_ttl())
+
+
+async def aget_authz_epoch(user_id):
+    return await _aread_through(epoch_key(user_id), lambda: _load_epoch(user_id), _epoch_ttl())
+
+
+def invalidate_user(user_id):
+    patient_ids = Patient.objects.filter(user_id=user_id).values_list('patient_id', flat=True)
+    clinician_ids = Clinician.objects.filter(user_id=user_id).values_list('clinician_id', flat=True)
+    cache.delete_many(
+        [user_key(user_id), epoch_key(user_id)]
+        + [patient_key(pid) for pid in patient_ids]
+        + [clinician_key(cid) for cid in clinician_ids]
+    )
+
+
+def invalidate_patient(patient_id):
+    cache.delete(patient_key(patient_id))
+
+
+def invalidate_clinician(clinician_id):
+    cache.delete(clinician_key(clinician_id))
+
+
+def invalidate_epoch(user_id):
+    cache.delete(epoch_key(user_id))
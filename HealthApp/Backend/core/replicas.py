@@ -0,0 +1,82 @@
+"""Read-replica routing with read-your-writes stickiness.
+
+Reads go to the primary (``default``) unless ``ReplicaPinningMiddleware`` has
+marked the current request as replica-safe: a GET/HEAD/OPTIONS from a caller
+who has not written anything in the last ``DATABASE_REPLICA_PIN_SECONDS``.
+Writes always go to the primary, and a caller's write pins their following
+requests to it for that long (across devices, since the pin is keyed by user
+in the cache). One replica serves all of a request's reads, so replicas
+lagging by different amounts are never mixed. Code outside a request
+(run_worker, management commands) never reads from a replica.
+
+Pins only work when every process shares the cache, so without
+``SHARED_CACHE`` replicas are not used at all.
+
+Loads whose result is cached for longer than the replication lag (profile
+cache, directory facets) run under ``use_primary()`` so a lagging replica
+cannot be copied into the cache.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+PRIMARY = 'default'
+
+_read_alias = contextvars.ContextVar('read_alias', default=PRIMARY)
+
+
+def replica_aliases():
+    # a pin in a per-process cache is invisible to the other workers
+    return settings.DATABASE_REPLICAS if settings.SHARED_CACHE else []
+
+
+@contextmanager
+def allow_replica_reads(allowed=True):
+    """Context whose reads go to one randomly picked replica (if ``allowed``)."""
+    replicas = replica_aliases()
+    token = _read_alias.set(random.choice(replicas) if allowed and replicas else PRIMARY)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def use_primary():
+    """Context in which every read goes to the primary."""
+    return allow_replica_reads(False)
+
+
+def pin_key(user_id):
+    return f'core:db-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Send ``user_id``'s reads to the primary until replicas have caught up."""
+    cache.set(pin_key(user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(pin_key(user_id), False)
+
+
+async def ais_pinned(user_id):
+    return await cache.aget(pin_key(user_id), False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get the schema by replication, not by migrate
+        return db == PRIMARY
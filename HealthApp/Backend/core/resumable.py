@@ -0,0 +1,140 @@
+"""Resumable (chunked) document uploads.
+
+A client opens an ``UploadSession`` declaring the total size, then PUTs the
+file in pieces with ``Content-Range: bytes <start>-<end>/<size>``. Every piece
+must start at the committed offset; whatever part of a piece arrives before a
+dropped connection is still committed, so the client asks for the offset and
+carries on from there. A PUT claims the offset before touching the file, so
+concurrent PUTs of the same piece cannot both write. Bytes go straight into a temp file in document storage
+and the session's expiry slides forward with each piece; ``cleanup_expired``
+(the ``cleanup_uploads`` command) removes abandoned sessions and their files.
+"""
+import hashlib
+import os
+import re
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import UploadSession
+from .storage import document_storage
+from .uploads import PDF_SIGNATURE
+
+READ_CHUNK_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class UploadError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _expiry():
+    return timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+
+def create_session(patient, user_id, size):
+    """Open a session for a ``size``-byte upload, with an empty temp file."""
+    if size <= 0:
+        raise UploadError("Upload size must be a positive integer.")
+    if size > settings.RESUMABLE_UPLOAD_MAX_SIZE:
+        raise UploadError(f"File too large (>{settings.RESUMABLE_UPLOAD_MAX_SIZE} bytes).", 413)
+    storage = document_storage()
+    temp_name = storage.temp_name()
+    path = storage.path(temp_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'xb').close()
+    return UploadSession.objects.create(
+        patient=patient,
+        created_by_id=user_id,
+        size=size,
+        temp_name=temp_name,
+        expires_at=_expiry(),
+    )
+
+
+def parse_content_range(header):
+    """``(start, end)`` (inclusive) from a PUT's Content-Range, or None."""
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        return None
+    start, end = int(match.group(1)), int(match.group(2))
+    return (start, end) if end >= start else None
+
+
+def write_chunk(session, stream, start, length):
+    """Write up to ``length`` bytes read from ``stream`` at ``start``.
+
+    Returns the new committed offset; a short read (dropped connection)
+    commits the bytes that did arrive.
+    """
+    if start != session.offset:
+        raise UploadError(f"Expected a chunk starting at offset {session.offset}.", 409)
+    if start + length > session.size:
+        raise UploadError("Chunk extends past the declared upload size.")
+    if length > settings.RESUMABLE_CHUNK_MAX_SIZE:
+        raise UploadError(f"Chunk too large (>{settings.RESUMABLE_CHUNK_MAX_SIZE} bytes).", 413)
+
+    # claim the offset first; a writer that died keeps it only until its lock goes stale
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.RESUMABLE_CHUNK_LOCK_TIMEOUT)
+    claimed = UploadSession.objects.filter(
+        Q(locked_by='') | Q(locked_at__lt=stale), pk=session.pk, offset=start,
+    ).update(locked_by=token, locked_at=now)
+    if not claimed:
+        raise UploadError("Another request is writing to this upload.", 409)
+
+    committed = start
+    try:
+        with open(document_storage().path(session.temp_name), 'r+b') as out:
+            # drop any uncommitted tail left by an interrupted earlier attempt
+            out.seek(start)
+            out.truncate()
+            while committed < start + length:
+                data = stream.read(min(READ_CHUNK_SIZE, start + length - committed))
+                if not data:
+                    break
+                out.write(data)
+                committed += len(data)
+            if start < len(PDF_SIGNATURE) <= committed:
+                out.seek(0)
+                if out.read(len(PDF_SIGNATURE)) != PDF_SIGNATURE:
+                    # only this piece is rejected; earlier ones stay committed
+                    out.truncate(start)
+                    committed = start
+                    raise UploadError("Uploaded file is not a valid PDF (missing %PDF header).")
+    finally:
+        released = UploadSession.objects.filter(pk=session.pk, locked_by=token).update(
+            offset=committed, locked_by='', locked_at=None, expires_at=_expiry(),
+        )
+    if not released:
+        raise UploadError("Another request took over this upload.", 409)
+    session.offset = committed
+    return committed
+
+
+def finalize(session):
+    """SHA-256 of a fully uploaded session's file (which is re-validated)."""
+    if session.offset != session.size:
+        raise UploadError(f"Upload incomplete ({session.offset}/{session.size} bytes).", 409)
+    hasher = hashlib.sha256()
+    with open(document_storage().path(session.temp_name), 'rb') as f:
+        if f.read(len(PDF_SIGNATURE)) != PDF_SIGNATURE:
+            raise UploadError("Uploaded file is not a valid PDF (missing %PDF header).")
+        f.seek(0)
+        for data in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def cleanup_expired(now=None):
+    """Delete expired sessions (their temp files go with them); returns the count."""
+    count, _ = UploadSession.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return count
@@ -0,0 +1,140 @@
+"""Full-text indexes over patients and document text (SQLite FTS5).
+
+``core_patient_fts`` holds one row per patient (rowid = patient_id) with the
+owner's names and the health description. It is kept in sync by the signal
+handlers in ``core.signals``; code that bypasses ``save()`` (bulk_create,
+queryset.update) must call ``index_patients`` itself.
+
+``core_document_fts`` indexes ``DocumentText.content`` (rowid = document_id);
+database triggers keep it in sync, so nothing needs to call into it. Searches
+are always scoped to one patient's documents.
+
+On other database vendors search falls back to plain ``LIKE`` filters.
+"""
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import User, Patient, DocumentText
+
+FTS_TABLE = 'core_patient_fts'
+DOCUMENT_FTS_TABLE = 'core_document_fts'
+
+SNIPPET_TOKENS = 16
+SNIPPET_CHARS = 120
+
+# FTS5 wraps matches in these; they are swapped for <mark> after escaping
+MARK_OPEN = '\x02'
+MARK_CLOSE = '\x03'
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def _quote(term):
+    """Quote a user term as an FTS5 string so it cannot inject query syntax."""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def build_match(text=None, name_prefix=None):
+    """FTS5 MATCH expression for free text and/or a name prefix; None if empty."""
+    clauses = []
+    if text:
+        terms = [_quote(t) for t in text.split()]
+        if terms:
+            clauses.append('health_description : (' + ' AND '.join(terms) + ')')
+    if name_prefix:
+        terms = [_quote(t) + ' *' for t in name_prefix.split()]
+        if terms:
+            clauses.append('{first_name last_name} : (' + ' AND '.join(terms) + ')')
+    return ' AND '.join(clauses) or None
+
+
+def filter_patients(queryset, text=None, name_prefix=None):
+    """Restrict a Patient queryset to rows matching the text/name filters."""
+    if not text and not name_prefix:
+        return queryset
+    if fts_enabled():
+        match = build_match(text, name_prefix)
+        if match is None:
+            return queryset
+        ids = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        return queryset.filter(patient_id__in=ids)
+    for term in (text or '').split():
+        queryset = queryset.filter(health_description__icontains=term)
+    if name_prefix:
+        queryset = queryset.filter(
+            Q(user__first_name__istartswith=name_prefix) | Q(user__last_name__istartswith=name_prefix)
+        )
+    return queryset
+
+
+def index_patients(patient_ids):
+    """(Re)index the given patients from their current rows."""
+    if not fts_enabled() or not patient_ids:
+        return
+    placeholders = ','.join(['%s'] * len(patient_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', list(patient_ids))
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, first_name, last_name, health_description) '
+            f'SELECT p.patient_id, u.first_name, u.last_name, COALESCE(p.health_description, \'\') '
+            f'FROM {Patient._meta.db_table} p JOIN "{User._meta.db_table}" u ON u.id = p.user_id '
+            f'WHERE p.patient_id IN ({placeholders})',
+            list(patient_ids),
+        )
+
+
+def unindex_patient(patient_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [patient_id])
+
+
+def search_documents(patient_id, text, limit):
+    """Best matches for ``text`` among a patient's documents.
+
+    Returns ``[(document_id, snippet, score)]`` best first. The snippet is
+    HTML-escaped document text with matched terms wrapped in
+    ``<mark>``/``</mark>``. ``score`` is None without FTS.
+    """
+    terms = text.split()
+    if not terms:
+        return []
+    if fts_enabled():
+        match = ' AND '.join(_quote(t) for t in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT f.rowid, snippet({DOCUMENT_FTS_TABLE}, 0, %s, %s, '…', %s), "
+                f"bm25({DOCUMENT_FTS_TABLE}) "
+                f"FROM {DOCUMENT_FTS_TABLE} f JOIN {DocumentText._meta.db_table} t ON t.document_id = f.rowid "
+                f"WHERE {DOCUMENT_FTS_TABLE} MATCH %s AND t.patient_id = %s "
+                f"ORDER BY bm25({DOCUMENT_FTS_TABLE}) LIMIT %s",
+                [MARK_OPEN, MARK_CLOSE, SNIPPET_TOKENS, match, patient_id, limit],
+            )
+            # bm25 is lower-is-better; report higher-is-better
+            return [(document_id, _highlight(snippet), -score) for document_id, snippet, score in cursor.fetchall()]
+
+    queryset = DocumentText.objects.filter(patient_id=patient_id)
+    for term in terms:
+        queryset = queryset.filter(content__icontains=term)
+    rows = queryset.order_by('-document_id').values_list('document_id', 'content')[:limit]
+    return [(document_id, _plain_snippet(content, terms[0]), None) for document_id, content in rows]
+
+
+def _highlight(snippet):
+    """Escape an FTS snippet, then turn its match sentinels into ``<mark>`` tags."""
+    return str(escape(snippet)).replace(MARK_OPEN, '<mark>').replace(MARK_CLOSE, '</mark>')
+
+
+def _plain_snippet(content, term):
+    at = content.lower().find(term.lower())
+    start = max(at - SNIPPET_CHARS // 2, 0)
+    end = at + len(term)
+    return (
+        ('…' if start else '') + escape(content[start:at]) + '<mark>' + escape(content[at:end]) + '</mark>'
+        + escape(content[end:end + SNIPPET_CHARS // 2]) + ('…' if end + SNIPPET_CHARS // 2 < len(content) else '')
+    )
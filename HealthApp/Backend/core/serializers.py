@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import User, Patient, Clinician, Document
+from .models import User, Patient, Clinician, Document, UploadSession
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -33,13 +33,26 @@ class ClinicianSerializer(serializers.ModelSerializer):
             "speciality"
         )
 
+class ClinicianDirectorySerializer(serializers.ModelSerializer):
+    first_name = serializers.CharField(source='user.first_name', read_only=True)
+    last_name = serializers.CharField(source='user.last_name', read_only=True)
+    class Meta:
+        model = Clinician
+        fields = (
+            "clinician_id",
+            "first_name",
+            "last_name",
+            "gender",
+            "speciality"
+        )
+
 class DocumentSerializer(serializers.ModelSerializer):
     download_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Document
-        fields = ['document_id', 'uploaded_time', 'patient', 'uploaded_by', 'file_path', 'download_url']
-        read_only_fields = ['document_id', 'uploaded_time', 'file_path', 'download_url']
+        fields = ['document_id', 'uploaded_time', 'patient', 'uploaded_by', 'file_path', 'page_count', 'download_url']
+        read_only_fields = ['document_id', 'uploaded_time', 'file_path', 'page_count', 'download_url']
 
     def get_download_url(self, obj):
         request = self.context.get('request')
@@ -47,4 +60,10 @@ class DocumentSerializer(serializers.ModelSerializer):
             return None
         return request.build_absolute_uri(
             f"/api/patients/{obj.patient_id}/documents/{obj.document_id}/download/"
-        )
\ No newline at end of file
+        )
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['upload_id', 'patient', 'size', 'offset', 'created_at', 'expires_at']
@@ -0,0 +1,94 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import User, Patient, Clinician, Document, DocumentChange, UploadSession
+from .auth import bump_authz_epoch
+from .blobs import release_blob, schedule_file_deletion
+from .storage import digest_of
+from .search import index_patients, unindex_patient
+from .directory import invalidate_speciality_facets
+from .profile_cache import invalidate_user, invalidate_patient, invalidate_clinician
+from .changes import record_document_changes
+from .tasks import schedule_text_extraction
+
+
+@receiver(post_save, sender=Patient)
+def patient_saved(sender, instance, **kwargs):
+    index_patients([instance.patient_id])
+    invalidate_patient(instance.patient_id)
+
+
+@receiver(post_delete, sender=Patient)
+def patient_deleted(sender, instance, **kwargs):
+    unindex_patient(instance.patient_id)
+    DocumentChange.objects.filter(patient_id=instance.patient_id).delete()
+    invalidate_patient(instance.patient_id)
+    # tokens still claim the patient_id
+    bump_authz_epoch(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_user(instance.id)
+    # names are indexed on every patient profile the user owns
+    if update_fields is not None and not {'first_name', 'last_name'} & set(update_fields):
+        return
+    patient_ids = list(Patient.objects.filter(user_id=instance.id).values_list('patient_id', flat=True))
+    index_patients(patient_ids)
+
+
+@receiver(post_save, sender=Clinician)
+@receiver(post_delete, sender=Clinician)
+def clinician_changed(sender, instance, **kwargs):
+    invalidate_speciality_facets()
+    invalidate_clinician(instance.clinician_id)
+
+
+@receiver(post_delete, sender=Clinician)
+def clinician_deleted(sender, instance, **kwargs):
+    # tokens still claim the clinician_id (and clinician access)
+    bump_authz_epoch(instance.user_id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_user(instance.id)
+
+
+@receiver(post_save, sender=Document)
+def document_saved(sender, instance, created, **kwargs):
+    kind = DocumentChange.CREATED if created else DocumentChange.UPDATED
+    record_document_changes(instance.patient_id, [(instance.document_id, kind)])
+
+
+@receiver(post_delete, sender=Document)
+def document_deleted(sender, instance, **kwargs):
+    # the tombstone tells syncing clients to drop their copy
+    record_document_changes(instance.patient_id, [(instance.document_id, DocumentChange.DELETED)])
+
+
+@receiver(post_save, sender=Document)
+def document_created(sender, instance, created, **kwargs):
+    if created:
+        schedule_text_extraction([instance.document_id])
+
+
+@receiver(post_delete, sender=Document)
+def document_blob_released(sender, instance, **kwargs):
+    # the reference was taken by document storage when the blob was named
+    digest = digest_of(instance.file.name) if instance.file else None
+    if digest:
+        release_blob(digest)
+    elif instance.file:
+        # pre content-addressing upload: the file belongs to this row alone
+        schedule_file_deletion(instance.file.name)
+
+
+@receiver(post_delete, sender=UploadSession)
+def upload_session_deleted(sender, instance, **kwargs):
+    # a finalized session's file has already been moved; deleting is a no-op
+    schedule_file_deletion(instance.temp_name)
@@ -0,0 +1,98 @@
+"""Content-addressed storage for patient documents.
+
+Files are stored once per distinct content under
+``blobs/<aa>/<bb>/<sha256>.pdf`` (sharded by the first two digest bytes).
+Saving content that already exists returns the existing name instead of
+writing a second copy; how many ``Document`` rows point at a blob is tracked
+by ``DocumentBlob.ref_count`` (see ``core.blobs``).
+
+Choosing a blob name takes a reference on it in the same transaction, before
+an existing blob is reused, so the deletion job cannot unlink it in between.
+Callers save the referencing Document(s) in that transaction too, so a
+failed insert rolls the reference back with it.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+
+def blob_name(digest):
+    return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.pdf"
+
+
+BLOB_NAME_RE = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.pdf$')
+
+
+def digest_of(name):
+    """Digest encoded in a blob name, or None for any other stored name."""
+    match = BLOB_NAME_RE.match(name or '')
+    return match.group(1) if match else None
+
+
+def file_digest(content):
+    """SHA-256 hex digest of a Django File, leaving it rewound."""
+    hasher = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return hasher.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def temp_name(self):
+        """Fresh name for an in-progress write; see ``adopt``."""
+        return f"tmp/{uuid.uuid4().hex}.part"
+
+    def adopt(self, temp_name, digest, acquire=True):
+        """Move a fully written temp file to its blob name and return that name.
+
+        A rename, never a copy; if the blob already exists the temp file is
+        simply dropped. Either way the blob gains one reference, unless the
+        caller already took it in the current transaction (``acquire=False``).
+        """
+        name = blob_name(digest)
+        with transaction.atomic(savepoint=False):
+            if acquire:
+                self._reference(digest, name, self.size(temp_name))
+            if self.exists(name):
+                self.delete(temp_name)
+            else:
+                self._move(temp_name, name)
+        return name
+
+    def _save(self, name, content):
+        # ``name`` (from upload_to) is ignored: content decides the name
+        digest = file_digest(content)
+        name = blob_name(digest)
+        with transaction.atomic(savepoint=False):
+            self._reference(digest, name, content.size)
+            if not self.exists(name):
+                self._move(super()._save(self.temp_name(), content), name)
+        return name
+
+    def _reference(self, digest, name, size):
+        from .blobs import acquire_blobs  # core.blobs imports the models, which import this module
+        acquire_blobs({digest: (name, size, 1)})
+
+    def _move(self, temp_name, name):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.path(temp_name), path)
+
+
+_document_storage = None
+
+
+def document_storage():
+    """Storage for ``Document.file`` (callable so migrations stay portable)."""
+    global _document_storage
+    if _document_storage is None:
+        _document_storage = ContentAddressedStorage()
+    return _document_storage
@@ -0,0 +1,79 @@
+"""Background job handlers (run by the ``run_worker`` command, see core.jobs).
+
+``extract_document_text`` reads a stored PDF's text and page count off the
+request path and stores the text in ``DocumentText``, whose triggers keep the
+``core_document_fts`` index current. Documents sharing a blob reuse the text
+already extracted for it.
+
+``delete_stored_file`` removes files queued by ``core.blobs.schedule_file_deletion``;
+a filesystem error fails the job, so it is retried rather than forgotten.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from pypdf import PdfReader
+
+from .blobs import DELETE_FILE, discard_unreferenced
+from .changes import record_document_changes
+from .jobs import enqueue_many, job_handler
+from .models import Document, DocumentChange, DocumentText
+from .search import MARK_CLOSE, MARK_OPEN
+from .storage import document_storage
+
+EXTRACT_TEXT = 'extract_document_text'
+
+
+def schedule_text_extraction(document_ids):
+    enqueue_many(EXTRACT_TEXT, [{'document_id': document_id} for document_id in document_ids])
+
+
+def extract_pdf_text(path, max_chars):
+    """``(text, page_count)`` of a PDF; text stops after about ``max_chars``."""
+    reader = PdfReader(path)
+    parts = []
+    length = 0
+    for page in reader.pages:
+        text = page.extract_text() or ''
+        parts.append(text)
+        length += len(text)
+        if length >= max_chars:
+            break
+    # the search snippet markers must only ever come from FTS
+    text = '\n'.join(parts).replace(MARK_OPEN, '').replace(MARK_CLOSE, '')
+    return text[:max_chars], len(reader.pages)
+
+
+@job_handler(EXTRACT_TEXT)
+def extract_document_text(document_id):
+    doc = Document.objects.filter(pk=document_id).values('file', 'patient_id', 'sha256').first()
+    if doc is None:
+        return  # deleted before we got to it
+
+    extracted = None
+    if doc['sha256']:
+        extracted = (
+            DocumentText.objects
+            .filter(document__sha256=doc['sha256'], document__page_count__isnull=False)
+            .values_list('content', 'document__page_count')
+            .first()
+        )
+    if extracted is None:
+        extracted = extract_pdf_text(document_storage().path(doc['file']), settings.DOCUMENT_TEXT_MAX_CHARS)
+    content, page_count = extracted
+
+    with transaction.atomic():
+        DocumentText.objects.update_or_create(
+            document_id=document_id,
+            defaults={'patient_id': doc['patient_id'], 'content': content},
+        )
+        Document.objects.filter(pk=document_id).update(page_count=page_count, text_extracted_at=timezone.now())
+        # page_count is part of the document representation
+        record_document_changes(doc['patient_id'], [(document_id, DocumentChange.UPDATED)])
+
+
+@job_handler(DELETE_FILE)
+def delete_stored_file(name, digest=None):
+    if digest:
+        discard_unreferenced(digest, name)
+    else:
+        document_storage().delete(name)
@@ -1,3 +1,1342 @@
-from django.test import TestCase
+import importlib.util
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import types
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .auth import (
+    bump_authz_epoch, deletable_documents, get_request_principal, load_principal, visible_documents,
+    visible_patients,
+)
+from .blobs import DELETE_FILE, discard_unreferenced
+from . import hashing
+from .bulk_import import import_records, read_records
+from .directory import speciality_facets
+from .fast_serializers import ValuesSerializer
+from .jobs import HANDLERS, claim, enqueue, job_handler, requeue_stale, run, work
+from .pagination import KeysetPaginator
+from .profile_cache import get_clinician_profile, get_patient_profile, get_user_profile
+from .models import (
+    User, Patient, Clinician, Document, DocumentBlob, DocumentText, ImportRun, Job, UploadSession,
+)
+from .resumable import UploadError, create_session, write_chunk
+from .search import DOCUMENT_FTS_TABLE, FTS_TABLE, _plain_snippet, filter_patients, search_documents
+from .token_cache import VerifiedTokenCache, token_cache
+from .tokens import ClaimsTokenObtainPairSerializer
+from .serializers import PatientSerializer, ClinicianSerializer, ClinicianDirectorySerializer, DocumentSerializer
+from .storage import blob_name, document_storage, file_digest
+
+PDF = b'%PDF-1.4\n'
+
+
+class IsolationMixin:
+    """Give each test class its own MEDIA_ROOT, and each test an empty cache.
+
+    Rolled-back rows free their ids for reuse, so cached profiles, pins and
+    epochs from one test would otherwise leak into the next. Reads stay on
+    the primary unless a class names its own ``replicas``: replicas from the
+    environment are test mirrors of it, outside each test's transaction.
+    """
+    replicas = []
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media_root = tempfile.mkdtemp()
+        cls._media_override = override_settings(MEDIA_ROOT=cls._media_root, DATABASE_REPLICAS=cls.replicas)
+        cls._media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._media_override.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+
+    def tearDown(self):
+        cache.clear()
+        super().tearDown()
+
+
+def make_patient(username='patient', **fields):
+    user = User.objects.create_user(username=username, password=None, first_name='Pat', last_name='Ient')
+    return Patient.objects.create(user=user, age=fields.pop('age', 40), sex=fields.pop('sex', 'Female'),
+                                  health_description=fields.pop('health_description', ''), **fields)
+
+
+def make_document(patient, body):
+    doc = Document(patient=patient, uploaded_by=patient.user)
+    doc.file.save('doc.pdf', ContentFile(body), save=False)
+    doc.save()
+    return doc
+
+
+class DocumentSearchSnippetTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        doc = make_document(self.patient, PDF + b'snippet')
+        self.document_id = doc.document_id
+        DocumentText.objects.create(
+            document=doc, patient=self.patient,
+            content='Notes <script>alert(1)</script> metformin & "other" <b>drugs</b>',
+        )
+
+    def test_fts_snippet_is_escaped_around_marks(self):
+        [(document_id, snippet, _)] = search_documents(self.patient.patient_id, 'metformin', 10)
+        self.assertEqual(document_id, self.document_id)
+        self.assertNotIn('<script>', snippet)
+        self.assertNotIn('<b>', snippet)
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertIn('<mark>metformin</mark>', snippet)
+
+    def test_plain_snippet_is_escaped_around_marks(self):
+        snippet = _plain_snippet('<i>x</i> Metformin <script>', 'metformin')
+        self.assertEqual(snippet, '&lt;i&gt;x&lt;/i&gt; <mark>Metformin</mark> &lt;script&gt;')
+
+
+class ConditionalGetTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        make_document(self.patient, PDF + b'conditional')
+        clinician_user = User.objects.create_user(username='clinician', password='pw')
+        self.clinician = Clinician.objects.create(user=clinician_user, age=50, gender='Male', speciality='GP')
+        self.as_patient = bearer(self.patient.user)
+        self.as_clinician = bearer(clinician_user)
+
+    def get(self, url, auth, **conditions):
+        return self.client.get(url, headers={**auth, **conditions})
+
+    def assert_conditional(self, url, auth):
+        response = self.get(url, auth)
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        for conditions in ({'If-None-Match': etag}, {'If-Modified-Since': last_modified}):
+            cached = self.get(url, auth, **conditions)
+            self.assertEqual(cached.status_code, 304, conditions)
+            self.assertEqual(cached.content, b'')
+            self.assertEqual((cached['ETag'], cached['Last-Modified']), (etag, last_modified))
+
+        # If-None-Match wins over a still-current If-Modified-Since
+        stale = self.get(url, auth, **{'If-None-Match': '"stale"', 'If-Modified-Since': last_modified})
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(self.get(url, auth, **{'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'}).status_code, 200)
+        return etag
+
+    def assert_changed(self, url, auth, old_etag):
+        response = self.get(url, auth, **{'If-None-Match': old_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], old_etag)
+        self.assertEqual(self.get(url, auth, **{'If-None-Match': response['ETag']}).status_code, 304)
+
+    def test_patient_details(self):
+        url = f'/api/patients/{self.patient.patient_id}/'
+        etag = self.assert_conditional(url, self.as_patient)
+        self.patient.health_description = 'updated'
+        self.patient.save()
+        self.assert_changed(url, self.as_patient, etag)
+
+    def test_clinician_details(self):
+        url = f'/api/clinicians/{self.clinician.clinician_id}/'
+        etag = self.assert_conditional(url, self.as_clinician)
+        self.clinician.speciality = 'Cardiology'
+        self.clinician.save()
+        self.assert_changed(url, self.as_clinician, etag)
+
+    def test_documents_list(self):
+        url = f'/api/patients/{self.patient.patient_id}/documents/'
+        etag = self.assert_conditional(url, self.as_patient)
+        upload = self.client.post(
+            f'{url}upload/', {'file': SimpleUploadedFile('b.pdf', PDF + b'another')}, headers=self.as_patient,
+        )
+        self.assertEqual(upload.status_code, 201)
+        self.assert_changed(url, self.as_patient, etag)
+
+    def test_validators_do_not_bypass_access_checks(self):
+        url = f'/api/patients/{self.patient.patient_id}/documents/'
+        etag = self.get(url, self.as_patient)['ETag']
+        stranger = make_patient(username='stranger')
+        response = self.get(url, bearer(stranger.user), **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 403)
+
+
+class SpecialityFacetsTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'doc{i}', password='pw') for i in range(3)]
+        self.gp = Clinician.objects.create(user=self.users[0], age=50, gender='Male', speciality='GP')
+
+    def counts(self):
+        return {facet['speciality']: facet['count'] for facet in speciality_facets()}
+
+    def test_facets_are_cached_between_changes(self):
+        self.assertEqual(self.counts(), {'GP': 1})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts(), {'GP': 1})
+
+    def test_clinician_create_save_and_delete_invalidate_facets(self):
+        self.assertEqual(self.counts(), {'GP': 1})
+        cardio = Clinician.objects.create(user=self.users[1], age=45, gender='Female', speciality='Cardiology')
+        self.assertEqual(self.counts(), {'Cardiology': 1, 'GP': 1})
+
+        self.gp.speciality = 'Cardiology'
+        self.gp.save()
+        self.assertEqual(self.counts(), {'Cardiology': 2})
+
+        cardio.delete()
+        self.assertEqual(self.counts(), {'Cardiology': 1})
+
+
+class SearchIndexSyncTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.patient = make_patient(health_description='type 2 diabetes')
+
+    def matches(self, **filters):
+        return list(filter_patients(Patient.objects.all(), **filters).values_list('patient_id', flat=True))
+
+    def indexed(self, table, rowid):
+        with connections['default'].cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {table} WHERE rowid = %s', [rowid])
+            return cursor.fetchone()[0]
+
+    def test_patient_saves_and_deletes_reach_the_index(self):
+        patient_id = self.patient.patient_id
+        self.assertEqual(self.matches(text='diabetes'), [patient_id])
+        self.patient.health_description = 'seasonal asthma'
+        self.patient.save()
+        self.assertEqual(self.matches(text='diabetes'), [])
+        self.assertEqual(self.matches(text='asthma'), [patient_id])
+
+        user = self.patient.user
+        user.first_name = 'Zelda'
+        user.save()
+        self.assertEqual(self.matches(name_prefix='zel'), [patient_id])
+        self.assertEqual(self.matches(name_prefix='pat'), [])
+
+        self.patient.delete()
+        self.assertEqual(self.indexed(FTS_TABLE, patient_id), 0)
+
+    def test_document_text_changes_reach_the_index(self):
+        doc = make_document(self.patient, PDF + b'fts')
+        document_id = doc.document_id
+        text = DocumentText.objects.create(document=doc, patient=self.patient, content='metformin 500mg')
+        self.assertEqual([hit[0] for hit in search_documents(self.patient.patient_id, 'metformin', 10)], [document_id])
+        text.content = 'insulin glargine'
+        text.save()
+        self.assertEqual(search_documents(self.patient.patient_id, 'metformin', 10), [])
+        self.assertEqual([hit[0] for hit in search_documents(self.patient.patient_id, 'insulin', 10)], [document_id])
+
+        doc.delete()
+        self.assertEqual(self.indexed(DOCUMENT_FTS_TABLE, document_id), 0)
+        self.assertEqual(search_documents(self.patient.patient_id, 'insulin', 10), [])
+
+
+class BlobReferenceTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        self.storage = document_storage()
+
+    def write_file(self, name, body):
+        path = self.storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(body)
+        return name
+
+    def test_identical_uploads_share_one_counted_blob(self):
+        first = make_document(self.patient, PDF + b'same')
+        second = make_document(self.patient, PDF + b'same')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(DocumentBlob.objects.get(sha256=first.sha256).ref_count, 2)
+
+        first.delete()
+        self.assertEqual(DocumentBlob.objects.get(sha256=first.sha256).ref_count, 1)
+        second.delete()
+        self.assertFalse(DocumentBlob.objects.filter(sha256=first.sha256).exists())
+        work(once=True)
+        self.assertFalse(self.storage.exists(first.file.name))
+
+    def test_reused_blob_is_referenced_before_its_temp_file_is_dropped(self):
+        doc = make_document(self.patient, PDF + b'race')
+        digest, name = doc.sha256, doc.file.name
+        doc.delete()  # last reference: deletion queued, not yet run
+        self.assertTrue(Job.objects.filter(kind=DELETE_FILE).exists())
+
+        # a new upload of the same content reuses the still-present blob ...
+        temp_name = self.write_file(self.storage.temp_name(), PDF + b'race')
+        self.assertEqual(self.storage.adopt(temp_name, digest), name)
+        self.assertFalse(self.storage.exists(temp_name))
+        # ... and the queued deletion (or a direct discard) now leaves it alone
+        work(once=True)
+        discard_unreferenced(digest, name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(DocumentBlob.objects.get(sha256=digest).ref_count, 1)
+
+    def test_failed_insert_rolls_back_the_reference(self):
+        body = PDF + b'rollback'
+        doc = Document(patient=self.patient, uploaded_by=self.patient.user, file_path=None)
+        doc.file = ContentFile(body, name='doc.pdf')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            doc.save()
+        self.assertFalse(DocumentBlob.objects.filter(sha256=file_digest(ContentFile(body))).exists())
+
+    def test_pre_content_addressing_file_is_deleted_with_its_row(self):
+        legacy = self.write_file('patients/1/legacy.pdf', PDF + b'legacy')
+        doc = Document.objects.create(patient=self.patient, file=legacy, sha256='ab' * 32)
+        self.assertFalse(DocumentBlob.objects.exists())
+        doc.delete()
+        work(once=True)
+        self.assertFalse(self.storage.exists(legacy))
+
+    def test_uncounted_blob_is_deleted_with_its_last_row(self):
+        digest = 'cd' * 32
+        name = self.write_file(blob_name(digest), PDF + b'uncounted')
+        doc = Document.objects.bulk_create([Document(patient=self.patient, file=name, file_path=name, sha256=digest)])[0]
+        doc.delete()
+        work(once=True)
+        self.assertFalse(self.storage.exists(name))
+
+
+class ResumableChunkTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        self.session = create_session(self.patient, self.patient.user_id, 16)
+
+    def stored(self):
+        with open(document_storage().path(self.session.temp_name), 'rb') as f:
+            return f.read()
+
+    def test_chunks_append_at_the_committed_offset(self):
+        self.assertEqual(write_chunk(self.session, io.BytesIO(b'%PDF-1'), 0, 6), 6)
+        self.assertEqual(write_chunk(self.session, io.BytesIO(b'.4\n'), 6, 3), 9)
+        self.assertEqual(self.stored(), b'%PDF-1.4\n')
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.offset, self.session.locked_by), (9, ''))
+
+    def test_a_claimed_offset_is_not_written_by_a_second_put(self):
+        write_chunk(self.session, io.BytesIO(b'%PDF'), 0, 4)
+        UploadSession.objects.filter(pk=self.session.pk).update(locked_by='other', locked_at=timezone.now())
+        with self.assertRaises(UploadError) as raised:
+            write_chunk(self.session, io.BytesIO(b'-XYZ'), 4, 4)
+        self.assertEqual(raised.exception.status_code, 409)
+        self.assertEqual(self.stored(), b'%PDF')
+
+    def test_a_stale_claim_is_taken_over(self):
+        stale = timezone.now() - timedelta(hours=1)
+        UploadSession.objects.filter(pk=self.session.pk).update(locked_by='gone', locked_at=stale)
+        self.assertEqual(write_chunk(self.session, io.BytesIO(b'%PDF'), 0, 4), 4)
+
+    def test_bad_signature_only_drops_the_rejected_piece(self):
+        write_chunk(self.session, io.BytesIO(b'%P'), 0, 2)
+        with self.assertRaises(UploadError):
+            write_chunk(self.session, io.BytesIO(b'XX'), 2, 2)
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.offset, self.session.locked_by), (2, ''))
+        self.assertEqual(self.stored(), b'%P')
+        self.assertEqual(write_chunk(self.session, io.BytesIO(b'DF'), 2, 2), 4)
+
+
+class DocumentFieldsSerializer(DocumentSerializer):
+    """DocumentSerializer without the request-dependent download_url."""
+    class Meta(DocumentSerializer.Meta):
+        fields = ['document_id', 'uploaded_time', 'patient', 'uploaded_by', 'file_path', 'page_count']
+
+
+class ValuesSerializerParityTests(IsolationMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='zoë', password=None, first_name='Zoë', last_name='Ñúñez 😀')
+        plain = User.objects.create_user(username='plain', password=None, first_name='', last_name='')
+        whole_second = timezone.now().replace(microsecond=0)
+        Patient.objects.create(user=owner, age=30, sex='Female', health_description='Asthma — seit 2019 ✓')
+        Patient.objects.create(user=plain, age=0, sex='Male', health_description=None, created_at=whole_second)
+        Clinician.objects.create(user=owner, age=45, gender='Not disclosed', speciality='Cardiología')
+        Clinician.objects.create(user=plain, age=60, gender='Male', speciality='', created_at=whole_second)
+
+    def assertParity(self, serializer_class, queryset):
+        expected = serializer_class(list(queryset), many=True).data
+        fast = ValuesSerializer(serializer_class)
+        actual = fast.many(fast.values(queryset))
+        self.assertEqual(actual, expected)
+        self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected))
+
+    def test_patients(self):
+        self.assertParity(PatientSerializer, Patient.objects.select_related('user').order_by('patient_id'))
+
+    def test_clinicians(self):
+        queryset = Clinician.objects.select_related('user').order_by('clinician_id')
+        self.assertParity(ClinicianSerializer, queryset)
+        self.assertParity(ClinicianDirectorySerializer, queryset)
+
+    def test_documents(self):
+        patient = Patient.objects.first()
+        make_document(patient, PDF + b'one')
+        orphan = make_document(patient, PDF + b'two')
+        Document.objects.filter(pk=orphan.pk).update(uploaded_by=None, page_count=3)
+        self.assertParity(DocumentFieldsSerializer, Document.objects.order_by('document_id'))
+
+    def test_unsupported_fields_are_rejected_up_front(self):
+        with self.assertRaises(TypeError):
+            ValuesSerializer(DocumentSerializer)
+
+
+def bearer(user):
+    token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+    return {'Authorization': f'Bearer {token}'}
+
+
+class PrincipalTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.first = make_patient()
+        self.second = Patient.objects.create(user=self.first.user, age=9, sex='Male')
+        self.document = make_document(self.second, PDF + b'second')
+        self.stranger = make_patient(username='stranger')
+
+    def test_loaded_in_one_query_with_every_owned_patient(self):
+        with self.assertNumQueries(1):
+            principal = load_principal(self.first.user_id)
+        self.assertEqual(principal.patient_ids, (self.first.patient_id, self.second.patient_id))
+        self.assertEqual(principal.patient_id, self.first.patient_id)
+        self.assertIsNone(principal.clinician_id)
+
+    def assert_owns_both(self, headers):
+        self.client = self.client_class(headers=headers)
+        for patient in (self.first, self.second):
+            base = f'/api/patients/{patient.patient_id}/'
+            self.assertEqual(self.client.get(base).status_code, 200)
+            self.assertEqual(self.client.get(f'{base}documents/').status_code, 200)
+            self.assertEqual(self.client.get(f'{base}documents/changes/').status_code, 200)
+        download = f'/api/patients/{self.second.patient_id}/documents/{self.document.document_id}/download/'
+        self.assertEqual(b''.join(self.client.get(download).streaming_content), PDF + b'second')
+        self.assertEqual(self.client.get(f'/api/patients/{self.stranger.patient_id}/').status_code, 403)
+
+    def test_claims_cover_every_owned_patient(self):
+        self.assert_owns_both(bearer(self.first.user))
+
+    def test_plain_token_covers_every_owned_patient(self):
+        token = AccessToken.for_user(self.first.user)
+        self.assert_owns_both({'Authorization': f'Bearer {token}'})
+
+    def test_document_list_round_trips(self):
+        self.client = self.client_class(headers=bearer(self.first.user))
+        url = f'/api/patients/{self.second.patient_id}/documents/'
+        # authz epoch, documents version, documents: no user/role lookups
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class AccessScopingTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.alice = make_patient(username='alice')
+        self.bob = make_patient(username='bob')
+        clinician_user = User.objects.create_user(username='doc', password=None, first_name='D', last_name='R')
+        Clinician.objects.create(user=clinician_user, age=50, gender='Male', speciality='GP')
+        self.clinician = load_principal(clinician_user.id)
+        self.alice_doc = make_document(self.alice, PDF + b'alice')
+        self.bob_doc = make_document(self.bob, PDF + b'bob')
+        # uploaded by the clinician onto alice's record
+        self.clinician_doc = Document(patient=self.alice, uploaded_by=clinician_user)
+        self.clinician_doc.file.save('c.pdf', ContentFile(PDF + b'clinician'), save=False)
+        self.clinician_doc.save()
+
+    def ids(self, queryset):
+        return sorted(queryset.values_list('pk', flat=True))
+
+    def test_patients_see_only_their_own_rows(self):
+        alice = load_principal(self.alice.user_id)
+        self.assertEqual(self.ids(visible_patients(alice)), [self.alice.patient_id])
+        self.assertEqual(self.ids(visible_documents(alice)), [self.alice_doc.pk, self.clinician_doc.pk])
+        self.assertEqual(self.ids(deletable_documents(alice)), [self.alice_doc.pk])
+
+    def test_clinicians_see_every_row_but_delete_only_their_uploads(self):
+        self.assertEqual(self.ids(visible_patients(self.clinician)), [self.alice.patient_id, self.bob.patient_id])
+        self.assertEqual(len(self.ids(visible_documents(self.clinician))), 3)
+        self.assertEqual(self.ids(deletable_documents(self.clinician)), [self.clinician_doc.pk])
+
+    def delete(self, user, patient, doc_id):
+        client = self.client_class(headers=bearer(user))
+        return client.delete(f'/api/patients/{patient.patient_id}/documents/{doc_id}/').status_code
+
+    def test_delete_tells_missing_from_forbidden(self):
+        clinician_user = self.clinician.user
+        self.assertEqual(self.delete(self.alice.user, self.bob, self.bob_doc.pk), 403)  # not her patient
+        self.assertEqual(self.delete(self.alice.user, self.alice, self.bob_doc.pk), 404)  # not on her record
+        self.assertEqual(self.delete(self.alice.user, self.alice, 999999), 404)
+        self.assertEqual(self.delete(self.alice.user, self.alice, self.clinician_doc.pk), 403)  # not her upload
+        self.assertEqual(self.delete(clinician_user, self.alice, self.alice_doc.pk), 403)
+        self.assertEqual(self.delete(clinician_user, self.alice, self.clinician_doc.pk), 204)
+        self.assertEqual(self.delete(self.alice.user, self.alice, self.alice_doc.pk), 204)
+        self.assertEqual(self.ids(Document.objects.all()), [self.bob_doc.pk])
+
+
+class VerifiedTokenCacheTests(IsolationMixin, TestCase):
+    def test_tampered_token_is_not_served_from_cache(self):
+        patient = make_patient()
+        headers = bearer(patient.user)
+        token = headers['Authorization'].split()[1]
+        self.assertIsNotNone(get_request_principal(RequestFactory().get('/', headers=headers)))
+        self.assertIsNotNone(token_cache.get(token))
+        header, payload, signature = token.split('.')
+        tampered = f"{header}.{payload}.{signature[:-2]}{'AA' if signature[-2:] != 'AA' else 'BB'}"
+        request = RequestFactory().get('/', headers={'Authorization': f'Bearer {tampered}'})
+        self.assertIsNone(get_request_principal(request))
+        self.assertIsNone(token_cache.get(tampered))
+
+    def test_entries_expire_at_exp(self):
+        tokens = VerifiedTokenCache()
+        with mock.patch('core.token_cache.time.time', return_value=1000):
+            tokens.set('t', {'exp': 1010})
+            self.assertEqual(tokens.get('t'), {'exp': 1010})
+        with mock.patch('core.token_cache.time.time', return_value=1010):
+            self.assertIsNone(tokens.get('t'))
+        self.assertEqual(tokens.stats()['size'], 0)
+
+    def test_tokens_without_exp_are_not_cached(self):
+        tokens = VerifiedTokenCache()
+        tokens.set('t', {'user_id': 1})
+        tokens.set('u', {'exp': 'soon'})
+        self.assertEqual(tokens.stats()['size'], 0)
+
+    def test_lru_is_bounded(self):
+        tokens = VerifiedTokenCache(max_entries=2)
+        exp = time.time() + 60
+        tokens.set('a', {'exp': exp})
+        tokens.set('b', {'exp': exp})
+        tokens.get('a')  # now most recently used
+        tokens.set('c', {'exp': exp})
+        self.assertEqual(tokens.stats()['size'], 2)
+        self.assertIsNone(tokens.get('b'))
+        self.assertIsNotNone(tokens.get('a'))
+        self.assertIsNotNone(tokens.get('c'))
+
+    def test_hit_and_miss_counters(self):
+        tokens = VerifiedTokenCache()
+        tokens.get('a')
+        tokens.set('a', {'exp': time.time() + 60})
+        tokens.get('a')
+        tokens.get('a')
+        tokens.set('old', {'exp': time.time() - 1})
+        tokens.get('old')  # expired: a miss
+        self.assertEqual(tokens.stats(), {'size': 1, 'hits': 2, 'misses': 2})
+        tokens.clear()
+        self.assertEqual(tokens.stats(), {'size': 0, 'hits': 0, 'misses': 0})
+
+
+class AuthzEpochTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        self.request = RequestFactory().get('/', headers=bearer(self.patient.user))
+
+    def bump_elsewhere(self):
+        # another process: its cache invalidation never reaches this one
+        User.objects.filter(id=self.patient.user_id).update(authz_epoch=F('authz_epoch') + 1)
+
+    @override_settings(AUTHZ_EPOCH_CACHE_TTL=0)
+    def test_epoch_read_every_request_without_shared_cache(self):
+        self.assertEqual(get_request_principal(self.request).patient_id, self.patient.patient_id)
+        self.bump_elsewhere()
+        self.assertIsNone(get_request_principal(self.request))
+
+    @override_settings(AUTHZ_EPOCH_CACHE_TTL=60)
+    def test_cached_epoch_dropped_by_bump(self):
+        self.assertIsNotNone(get_request_principal(self.request))
+        with self.assertNumQueries(0):
+            self.assertIsNotNone(get_request_principal(self.request))
+        bump_authz_epoch(self.patient.user_id)
+        self.assertIsNone(get_request_principal(self.request))
+
+
+class ClaimsTokenTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        self.refresh = ClaimsTokenObtainPairSerializer.get_token(self.patient.user)
+        self.client = self.client_class(headers={'Authorization': f'Bearer {self.refresh.access_token}'})
+        self.url = f'/api/patients/{self.patient.patient_id}/'
+
+    def test_claims_are_signed_into_the_access_token(self):
+        access = self.refresh.access_token
+        self.assertEqual(access['patient_ids'], [self.patient.patient_id])
+        self.assertEqual((access['is_clinician'], access['clinician_id']), (False, None))
+        self.assertEqual(access['authz_epoch'], 0)
+        request = RequestFactory().get('/', headers=bearer(self.patient.user))
+        with self.assertNumQueries(1):  # the epoch check only
+            self.assertIsNotNone(get_request_principal(request))
+
+    def test_role_change_revokes_then_refresh_rederives(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        response = self.client.post('/api/register-patient/', {'user_id': self.patient.user_id, 'age': 7, 'sex': 'Male'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+        access = self.client.post('/api/refresh/', {'refresh': str(self.refresh)}).json()['access']
+        self.client = self.client_class(headers={'Authorization': f'Bearer {access}'})
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get(f"/api/patients/{response.json()['patient_id']}/").status_code, 200)
+
+    def test_deleting_a_patient_revokes_its_claims(self):
+        Patient.objects.create(user=self.patient.user, age=7, sex='Male')
+        self.client = self.client_class(headers=bearer(self.patient.user))
+        self.patient.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_deleting_a_clinician_revokes_its_claims(self):
+        clinician = Clinician.objects.create(user=self.patient.user, age=50, gender='Male', speciality='GP')
+        self.client = self.client_class(headers=bearer(self.patient.user))
+        self.assertEqual(self.client.get('/api/patients/').status_code, 200)
+        clinician.delete()
+        self.assertEqual(self.client.get('/api/patients/').status_code, 401)
+
+
+class ProfileCacheTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        self.clinician = Clinician.objects.create(user=self.patient.user, age=50, gender='Male', speciality='GP')
+
+    def test_warm_reads_skip_the_database(self):
+        get_patient_profile(self.patient.patient_id)
+        get_clinician_profile(self.clinician.clinician_id)
+        get_user_profile(self.patient.user_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_patient_profile(self.patient.patient_id)['data']['age'], 40)
+            self.assertEqual(get_clinician_profile(self.clinician.clinician_id)['data']['speciality'], 'GP')
+            self.assertEqual(get_user_profile(self.patient.user_id)['first_name'], 'Pat')
+
+    def test_saves_invalidate(self):
+        get_patient_profile(self.patient.patient_id)
+        get_clinician_profile(self.clinician.clinician_id)
+        get_user_profile(self.patient.user_id)
+        self.patient.age = 41
+        self.patient.save()
+        self.clinician.speciality = 'Cardiology'
+        self.clinician.save()
+        user = self.patient.user
+        user.first_name = 'Renamed'
+        user.save()
+        self.assertEqual(get_patient_profile(self.patient.patient_id)['data']['age'], 41)
+        self.assertEqual(get_clinician_profile(self.clinician.clinician_id)['data']['speciality'], 'Cardiology')
+        self.assertEqual(get_user_profile(self.patient.user_id)['first_name'], 'Renamed')
+        # the patient profile nests the user
+        self.assertEqual(get_patient_profile(self.patient.patient_id)['data']['user']['first_name'], 'Renamed')
+
+    def test_deletes_invalidate(self):
+        patient_id = self.patient.patient_id
+        get_patient_profile(patient_id)
+        self.patient.delete()
+        self.assertIsNone(get_patient_profile(patient_id))
+
+    @override_settings(PROFILE_CACHE_TTL=0)
+    def test_ttl_zero_disables_caching(self):
+        get_patient_profile(self.patient.patient_id)
+        with self.assertNumQueries(1):
+            get_patient_profile(self.patient.patient_id)
+        self.assertIsNone(cache.get(f'core:patient:{self.patient.patient_id}'))
+
+
+@override_settings(PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_QUEUE_TIMEOUT=0.01)
+class HashingBusyTests(IsolationMixin, TestCase):
+    def setUp(self):
+        # every hashing slot taken by sign-ins still in progress
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        self.enterContext(mock.patch.object(hashing, '_slots', slots))
+        User.objects.create_user(username='signin', password='correct horse', first_name='S', last_name='I')
+
+    def assert_busy(self, response):
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(settings.PASSWORD_HASH_RETRY_AFTER))
+        self.assertEqual(response.json()['detail'], hashing.HashingBusy.default_detail)
+
+    def test_login_answers_503_with_retry_after(self):
+        self.assert_busy(self.client.post('/api/login/', {'username': 'signin', 'password': 'correct horse'}))
+
+    def test_register_answers_503_with_retry_after(self):
+        self.assert_busy(self.client.post('/api/register/', {'first_name': 'New', 'password': 'pw'}))
+        self.assertFalse(User.objects.filter(first_name='New').exists())
+
+    def test_free_slot_signs_in(self):
+        hashing._slots.release()
+        response = self.client.post('/api/login/', {'username': 'signin', 'password': 'correct horse'})
+        self.assertEqual(response.status_code, 200)
+
+
+class KeysetPaginatorTests(IsolationMixin, TestCase):
+    def setUp(self):
+        now = timezone.now()
+        # ties on created_at, so pages must break them on patient_id
+        self.ids = [
+            make_patient(username=f'p{i}', created_at=now + timedelta(seconds=i // 3)).patient_id
+            for i in range(7)
+        ]
+        self.paginator = KeysetPaginator(('created_at', 'patient_id'), page_size=2)
+
+    def page(self, cursor=None):
+        request = RequestFactory().get('/', {'cursor': cursor} if cursor else {})
+        rows, next_cursor, previous_cursor = self.paginator.paginate(Patient.objects.all(), request)
+        return [row.patient_id for row in rows], next_cursor, previous_cursor
+
+    def test_pages_walk_forward_and_back(self):
+        pages, cursor, previous = [], None, None
+        while True:
+            ids, cursor, previous_cursor = self.page(cursor)
+            pages.append(ids)
+            previous = previous_cursor
+            if cursor is None:
+                break
+        self.assertEqual(sum(pages, []), self.ids)
+        back = []
+        while previous:
+            ids, _, previous = self.page(previous)
+            back.insert(0, ids)
+        self.assertEqual(back, pages[:-1])
+
+    def test_cursor_bounds_the_index_scan(self):
+        _, cursor, _ = self.page()
+        request = RequestFactory().get('/', {'cursor': cursor})
+        queryset, *_ = self.paginator._window(Patient.objects.all(), request)
+        plan = queryset.explain()
+        self.assertIn('patient_created_at_id_idx (created_at>?)', plan)
+
+
+class MyProfileTests(IsolationMixin, TestCase):
+    def test_document_stats_are_per_patient(self):
+        first = make_patient()
+        second = Patient.objects.create(user=first.user, age=8, sex='Male')
+        make_patient(username='other')  # documents of other users never count
+        make_document(second, PDF + b'one')
+        make_document(second, PDF + b'two')
+        self.client = self.client_class(headers=bearer(first.user))
+        with self.assertNumQueries(2):  # authz epoch, then the profile
+            data = self.client.get('/api/me/').json()
+        self.assertEqual(data['username'], 'patient')
+        self.assertEqual(data['patient_id'], first.patient_id)
+        self.assertEqual(data['document_count'], 0)
+        self.assertIsNone(data['latest_upload'])
+        self.assertEqual([(p['patient_id'], p['document_count']) for p in data['patients']],
+                         [(first.patient_id, 0), (second.patient_id, 2)])
+        self.assertIsNotNone(data['patients'][1]['latest_upload'])
+
+    def test_user_without_patients(self):
+        user = User.objects.create_user(username='staff', password=None, first_name='S', last_name='Taff')
+        self.client = self.client_class(headers=bearer(user))
+        data = self.client.get('/api/me/').json()
+        self.assertEqual((data['patient_id'], data['clinician_id'], data['document_count']), ('', '', 0))
+        self.assertEqual(data['patients'], [])
+
+
+def read_stored(name):
+    with document_storage().open(name) as f:
+        return f.read()
+
+
+def stored_files():
+    root = document_storage().location
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, files in os.walk(root) for f in files)
+
+
+class DocumentUploadTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        self.client = self.client_class(headers=bearer(self.patient.user))
+        self.url = f'/api/patients/{self.patient.patient_id}/documents/upload/'
+        self.files_before = stored_files()  # MEDIA_ROOT is per class
+
+    def upload(self, body, **extra):
+        return self.client.post(self.url, {'file': SimpleUploadedFile('a.pdf', body), **extra})
+
+    def test_pdf_is_stored_under_its_digest(self):
+        body = PDF + b'upload'
+        response = self.upload(body)
+        self.assertEqual(response.status_code, 201)
+        doc = Document.objects.get(pk=response.json()['document_id'])
+        digest = file_digest(ContentFile(body))
+        self.assertEqual(doc.sha256, digest)
+        self.assertEqual(doc.file.name, blob_name(digest))
+        self.assertEqual(stored_files(), sorted({*self.files_before, blob_name(digest)}))
+
+    def test_non_pdf_is_rejected_and_dropped(self):
+        response = self.upload(b'GIF89a not a pdf')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('%PDF', response.json()['detail'])
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(stored_files(), self.files_before)
+
+    @override_settings(MAX_UPLOAD_SIZE=1024)
+    def test_oversized_upload_is_cut_off(self):
+        response = self.upload(PDF + b'x' * 2048)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(stored_files(), self.files_before)
+
+    @override_settings(DATA_UPLOAD_MAX_NUMBER_FIELDS=1)
+    def test_stored_file_dropped_when_the_rest_of_the_body_fails(self):
+        # the fields after the file exceed the limit once it is already stored
+        response = self.upload(PDF + b'tail', a='1', b='2')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(stored_files(), self.files_before)
+
+
+class MediaGarbageCollectionTests(IsolationMixin, TestCase):
+    def setUp(self):
+        # orphans are whatever is on disk without a row, so start from nothing
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=root))
+        patient = make_patient()
+        self.referenced = make_document(patient, PDF + b'kept').file.name
+        self.session = create_session(patient, patient.user_id, 100).temp_name
+        self.orphan = self.write('patients/1/crashed.pdf')
+        self.young = self.write('tmp/in-flight.part', age=0)
+        for name in (self.referenced, self.session):
+            self.age(name)
+
+    def write(self, name, age=7200):
+        path = document_storage().path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(PDF)
+        self.age(name, age)
+        return name
+
+    def age(self, name, seconds=7200):
+        then = time.time() - seconds
+        os.utime(document_storage().path(name), (then, then))
+
+    def gc(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('gc_media', *args, stdout=out, stderr=err)
+        return out.getvalue().splitlines(), err.getvalue()
+
+    def test_report_only_by_default(self):
+        lines, summary = self.gc()
+        self.assertEqual(lines, [f'orphan\t{self.orphan}\t{len(PDF)}'])
+        self.assertIn('1 orphaned file(s)', summary)
+        self.assertEqual(stored_files(), sorted([self.referenced, self.session, self.orphan, self.young]))
+
+    def test_delete_removes_only_old_orphans(self):
+        lines, summary = self.gc('--delete')
+        self.assertEqual(lines, [f'deleted\t{self.orphan}\t{len(PDF)}'])
+        self.assertIn('1 deleted', summary)
+        self.assertEqual(stored_files(), sorted([self.referenced, self.session, self.young]))
+
+    def test_missing_files_are_reported(self):
+        doc = Document.objects.get()
+        document_storage().delete(doc.file.name)
+        lines, summary = self.gc()
+        self.assertIn(f'missing\t{doc.document_id}\t{doc.file_path}', lines)
+        self.assertIn('1 document(s) missing their file', summary)
+
+
+class DocumentChangesTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        docs = [make_document(self.patient, PDF + bytes([i])) for i in range(3)]
+        self.ids = [doc.document_id for doc in docs]
+        docs[0].delete()
+        self.client = self.client_class(headers=bearer(self.patient.user))
+        self.url = f'/api/patients/{self.patient.patient_id}/documents/changes/'
+
+    def feed(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def entries(self, page):
+        return [(c['seq'], c['type'], c['document_id']) for c in page['changes']]
+
+    def test_pages_with_tombstones(self):
+        first, second, third = self.ids
+        page = self.feed(limit=2)
+        # the first document's creation is superseded by its tombstone
+        self.assertEqual(self.entries(page), [(2, 'created', second)])
+        self.assertEqual((page['cursor'], page['has_more']), (2, True))
+        self.assertEqual(page['changes'][0]['document']['document_id'], second)
+
+        page = self.feed(since=2, limit=2)
+        self.assertEqual(self.entries(page), [(3, 'created', third), (4, 'deleted', first)])
+        self.assertIsNone(page['changes'][1]['document'])
+        self.assertEqual((page['cursor'], page['has_more']), (4, False))
+
+    def test_a_change_supersedes_earlier_ones_within_a_page(self):
+        first, second, third = self.ids
+        self.assertEqual(self.entries(self.feed()), [(2, 'created', second), (3, 'created', third), (4, 'deleted', first)])
+
+    def test_caught_up_client_gets_the_short_circuit(self):
+        with self.assertNumQueries(2):  # authz epoch, documents version
+            page = self.feed(since=4)
+        self.assertEqual(page, {'changes': [], 'cursor': 4, 'has_more': False})
+        self.assertEqual(self.feed(since=99)['cursor'], 99)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'x'}).status_code, 400)
+
+
+class BulkImportTests(IsolationMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'patients.ndjson')
+        records = [{'first_name': 'Ann', 'age': 30 + i, 'sex': 'Female'} for i in range(5)]
+        records[2]['sex'] = 'Unknown'
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+
+    def run_command(self, *args):
+        err = io.StringIO()
+        call_command('bulk_import', 'patients', self.path, '--batch-size', '2', '--workers', '0',
+                     '--run-id', 'test-run', *args, stdout=io.StringIO(), stderr=err)
+        return err.getvalue()
+
+    def test_resumes_after_the_last_committed_batch(self):
+        run = ImportRun.objects.create(key='test-run', kind='patients')
+        batches = import_records('patients', read_records(self.path, 'ndjson'), run, batch_size=2)
+        self.assertEqual(next(batches).position, 2)
+        batches.close()  # interrupted after the first batch
+        run.refresh_from_db()
+        self.assertEqual((run.position, run.imported, run.finished_at), (2, 2, None))
+        self.assertGreater(run.updated_at, run.started_at)
+
+        log = self.run_command()
+        self.assertIn('Resuming after record 2 (2 already created)', log)
+        self.assertIn('record 3: Sex should be Male or Female', log)
+        run.refresh_from_db()
+        self.assertEqual((run.position, run.imported, run.skipped), (5, 4, 1))
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(sorted(Patient.objects.values_list('age', flat=True)), [30, 31, 33, 34])
+
+        self.assertIn('Already imported (4 created, 1 skipped)', self.run_command())
+        self.assertEqual(Patient.objects.count(), 4)
+
+    def test_usernames_stay_unique_across_batches(self):
+        User.objects.create_user(username='ann_10001', password=None, first_name='Ann', last_name='')
+        # a tiny pool of suffixes, so batches collide with each other and the database
+        counter = itertools.count()
+        with mock.patch('core.bulk_import.random.randint', side_effect=lambda low, high: low + next(counter) % 3):
+            self.run_command()
+        usernames = list(User.objects.exclude(username='ann_10001').values_list('username', flat=True))
+        self.assertEqual(len(usernames), 4)
+        self.assertEqual(len(set(usernames) | {'ann_10001'}), 5)
+        for username in usernames:
+            self.assertRegex(username, r'^ann_\d{5,}$')
+
+
+class ExportNDJSONTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.patients = [make_patient(username=f'p{i}', health_description='caf\u00e9 \u2713') for i in range(3)]
+        clinician_user = User.objects.create_user(username='doc', password=None, first_name='D', last_name='R')
+        self.clinician = Clinician.objects.create(user=clinician_user, age=50, gender='Male', speciality='GP')
+
+    def assert_records(self, text, expected):
+        self.assertTrue(text.endswith('\n'))
+        lines = text.splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+        self.assertEqual(len(lines), len(expected))  # exactly one object per line
+
+    def expected(self, serializer, rows):
+        return [json.loads(JSONRenderer().render(serializer(row).data)) for row in rows]
+
+    def test_command_writes_one_object_per_line(self):
+        out = io.StringIO()
+        call_command('export_ndjson', 'patients', '--chunk-size', '2', stdout=out)
+        self.assert_records(out.getvalue(), self.expected(PatientSerializer, self.patients))
+
+    def test_view_streams_for_clinicians_only(self):
+        client = self.client_class(headers=bearer(self.clinician.user))
+        response = client.get('/api/export/clinicians/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        body = b''.join(response.streaming_content).decode()
+        self.assert_records(body, self.expected(ClinicianSerializer, [self.clinician]))
+
+        self.assertEqual(client.get('/api/export/unknown/').status_code, 404)
+        patient_client = self.client_class(headers=bearer(self.patients[0].user))
+        self.assertEqual(patient_client.get('/api/export/patients/').status_code, 403)
+
+
+@override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=30, JOB_LOCK_TIMEOUT=600)
+class JobQueueTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.calls = []
+        self.register('test_ok', lambda **payload: self.calls.append(payload))
+        self.register('test_fail', self.fail_job)
+
+    def register(self, kind, func):
+        job_handler(kind)(func)
+        self.addCleanup(HANDLERS.pop, kind)
+
+    def fail_job(self, **payload):
+        raise ValueError('broken payload')
+
+    def test_claims_due_jobs_once_in_order(self):
+        first = enqueue('test_ok', n=1)
+        second = enqueue('test_ok', n=2)
+        future = enqueue('test_ok', n=3)
+        Job.objects.filter(pk=future.pk).update(run_after=timezone.now() + timedelta(hours=1))
+        claimed = claim('worker-a', limit=1)
+        self.assertEqual([job.pk for job in claimed], [first.pk])
+        self.assertEqual((claimed[0].status, claimed[0].attempts, claimed[0].locked_by), (Job.RUNNING, 1, 'worker-a'))
+        # the next worker gets what is left and due; the future job waits
+        self.assertEqual([job.pk for job in claim('worker-b', limit=5)], [second.pk])
+        self.assertEqual(claim('worker-c', limit=5), [])
+
+    def test_success_runs_the_handler_and_deletes_the_job(self):
+        enqueue('test_ok', n=1)
+        [job] = claim('worker')
+        self.assertTrue(run(job))
+        self.assertEqual(self.calls, [{'n': 1}])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failures_back_off_then_stay_failed(self):
+        job = enqueue('test_fail')
+        before = timezone.now()
+        self.assertFalse(run(claim('worker')[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.PENDING, 1, ''))
+        self.assertIn('ValueError: broken payload', job.last_error)
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=30))
+        self.assertEqual(claim('worker'), [])  # not due yet
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertFalse(run(claim('worker')[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(claim('worker'), [])
+
+    def test_unknown_kind_fails(self):
+        job = enqueue('test_missing')
+        self.assertFalse(run(claim('worker')[0]))
+        job.refresh_from_db()
+        self.assertIn("No handler registered for job kind 'test_missing'", job.last_error)
+
+    def test_jobs_of_a_dead_worker_are_handed_out_again(self):
+        job = enqueue('test_ok', n=1)
+        claim('dead-worker')
+        self.assertEqual(requeue_stale(), 0)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=601))
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(work(worker='live-worker', once=True), (1, 0))
+        self.assertEqual(self.calls, [{'n': 1}])
+
+    def test_work_drains_the_queue(self):
+        enqueue('test_ok', n=1)
+        enqueue('test_fail')
+        enqueue('test_ok', n=2)
+        self.assertEqual(work(worker='w', batch=2, once=True), (2, 1))
+        self.assertEqual(list(Job.objects.values_list('kind', 'status')), [('test_fail', Job.PENDING)])
+
+
+class DocumentArchiveTests(IsolationMixin, TestCase):
+    def setUp(self):
+        self.alice = make_patient(username='alice')
+        self.bob = make_patient(username='bob')
+        self.alice_docs = [make_document(self.alice, PDF + b'alice %d' % i) for i in range(2)]
+        self.bob_doc = make_document(self.bob, PDF + b'bob')
+        self.client = self.client_class(headers=bearer(self.alice.user))
+        self.url = f'/api/patients/{self.alice.patient_id}/documents/archive/'
+
+    def archive(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+
+    def contents(self, docs):
+        return {f'document-{doc.document_id}.pdf': read_stored(doc.file.name) for doc in docs}
+
+    def test_archive_holds_the_patients_documents(self):
+        self.assertEqual(self.archive(self.url), self.contents(self.alice_docs))
+
+    def test_ids_never_reach_other_patients_documents(self):
+        first = self.alice_docs[0]
+        entries = self.archive(self.url, ids=f'{first.document_id},{self.bob_doc.document_id}')
+        self.assertEqual(entries, self.contents([first]))
+        self.assertEqual(self.client.get(self.url, {'ids': str(self.bob_doc.document_id)}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'ids': 'x'}).status_code, 400)
+
+    def test_other_patients_archive_is_forbidden(self):
+        url = f'/api/patients/{self.bob.patient_id}/documents/archive/'
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_missing_files_are_left_out(self):
+        gone, kept = self.alice_docs
+        document_storage().delete(gone.file.name)
+        self.assertEqual(self.archive(self.url), self.contents([kept]))
+
+
+class DocumentDownloadRangeTests(IsolationMixin, TestCase):
+    body = PDF + bytes(range(256)) * 4
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.doc = make_document(self.patient, self.body)
+        self.url = f'/api/patients/{self.patient.patient_id}/documents/{self.doc.document_id}/download/'
+        self.client = self.client_class(headers=bearer(self.patient.user))
+
+    def get(self, headers=None):
+        return self.client.get(self.url, headers=headers)
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+
+    def test_single_range(self):
+        response = self.get({'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.body)}')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), self.body[10:20])
+
+    def test_suffix_range(self):
+        response = self.get({'Range': 'bytes=-5'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.body[-5:])
+
+    def test_multiple_ranges(self):
+        response = self.get({'Range': 'bytes=0-3, 100-109'})
+        self.assertEqual(response.status_code, 206)
+        content_type, _, boundary = response['Content-Type'].partition('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        content = b''.join(response.streaming_content)
+        self.assertEqual(len(content), int(response['Content-Length']))
+        size = len(self.body)
+        expected = (
+            f'--{boundary}\r\nContent-Type: application/pdf\r\nContent-Range: bytes 0-3/{size}\r\n\r\n'.encode()
+            + self.body[0:4] + b'\r\n'
+            + f'--{boundary}\r\nContent-Type: application/pdf\r\nContent-Range: bytes 100-109/{size}\r\n\r\n'.encode()
+            + self.body[100:110] + b'\r\n'
+            + f'--{boundary}--\r\n'.encode()
+        )
+        self.assertEqual(content, expected)
+
+    def test_unsatisfiable_range(self):
+        response = self.get({'Range': f'bytes={len(self.body)}-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.body)}')
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        response = self.get({'Range': 'bytes=0-3', 'If-Range': etag})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.body[:4])
+
+        # a changed (or weak) validator gets the whole file instead
+        for stale in ('"0000"', f'W/{etag}'):
+            response = self.get({'Range': 'bytes=0-3', 'If-Range': stale})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), self.body)
+
+    def test_not_modified(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get({'If-None-Match': etag}).status_code, 304)
+
+    @override_settings(DOCUMENT_SENDFILE='x-accel-redirect', DOCUMENT_SENDFILE_PREFIX='/protected-media/')
+    def test_x_accel_redirect(self):
+        response = self.get({'Range': 'bytes=0-3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.doc.file.name}')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['ETag'], f'"{self.doc.sha256}"')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(DOCUMENT_SENDFILE='x-sendfile')
+    def test_x_sendfile(self):
+        response = self.get()
+        self.assertEqual(response['X-Sendfile'], self.doc.file.path)
+        self.assertEqual(response.content, b'')
+
+
+def async_urlconf():
+    """``core.urls`` as routed with ASYNC_VIEWS on, leaving the loaded module alone."""
+    spec = importlib.util.find_spec('core.urls')
+    module = importlib.util.module_from_spec(spec)
+    with override_settings(ASYNC_VIEWS=True):
+        spec.loader.exec_module(module)
+    urlconf = types.ModuleType('async_urls')
+    urlconf.urlpatterns = [path('api/', include(module))]
+    return urlconf
+
+
+class AsyncViewParityTests(IsolationMixin, TestCase):
+    """The async views answer exactly like the sync ones they replace."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.async_urls = async_urlconf()
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.stranger = make_patient(username='stranger')
+        self.document = make_document(self.patient, PDF + b'parity' * 100)
+        clinician_user = User.objects.create_user(username='doc', password=None, first_name='D', last_name='R')
+        self.clinician = Clinician.objects.create(user=clinician_user, age=50, gender='Male', speciality='GP')
+        self.as_patient = bearer(self.patient.user)
+        self.as_clinician = bearer(clinician_user)
+
+    def sync_response(self, url, headers):
+        response = self.client.get(url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    async def async_response(self, url, headers):
+        response = await self.async_client.get(url, headers=headers)
+        if response.streaming:
+            return response, b''.join([chunk async for chunk in response.streaming_content])
+        return response, response.content
+
+    def assert_same(self, url, headers=None, status=200, **extra):
+        headers = {**(headers or {}), **extra}
+        expected, expected_body = self.sync_response(url, headers)
+        with override_settings(ROOT_URLCONF=self.async_urls):
+            response, body = async_to_sync(self.async_response)(url, headers)
+            # resolved lazily, so while the async urlconf is in place
+            self.assertEqual(response.resolver_match.func.view_class.__module__, 'core.views_async')
+        self.assertEqual((response.status_code, expected.status_code), (status, status))
+        if response.get('Content-Type', '').startswith('application/json'):
+            self.assertEqual(json.loads(body), json.loads(expected_body))
+        else:
+            self.assertEqual(body, expected_body)
+        for header in ('ETag', 'Last-Modified', 'Content-Range', 'Content-Type'):
+            self.assertEqual(response.get(header), expected.get(header), header)
+        return response
+
+    def test_patient_details(self):
+        url = f'/api/patients/{self.patient.patient_id}/'
+        response = self.assert_same(url, self.as_patient)
+        self.assert_same(url, self.as_patient, status=304, If_None_Match=response['ETag'])
+        self.assert_same(url, self.as_clinician)
+        self.assert_same(f'/api/patients/{self.stranger.patient_id}/', self.as_patient, status=403)
+        self.assert_same('/api/patients/999999/', self.as_clinician, status=404)
+        self.assert_same(url, status=401)
+
+    def test_clinician_details(self):
+        self.assert_same(f'/api/clinicians/{self.clinician.clinician_id}/', self.as_clinician)
+        self.assert_same(f'/api/clinicians/{self.clinician.clinician_id}/', self.as_patient, status=403)
+
+    def test_patient_list(self):
+        self.assert_same('/api/patients/?page_size=1', self.as_clinician)
+        self.assert_same('/api/patients/', self.as_patient, status=403)
+        self.assert_same('/api/patients/?cursor=bogus', self.as_clinician, status=400)
+
+    def test_documents_and_changes(self):
+        url = f'/api/patients/{self.patient.patient_id}/documents/'
+        response = self.assert_same(url, self.as_patient)
+        self.assert_same(url, self.as_patient, status=304, If_None_Match=response['ETag'])
+        self.assert_same(f'{url}changes/', self.as_patient)
+        self.assert_same(f'{url}changes/?since=1', self.as_patient)
+        self.assert_same(f'/api/patients/{self.stranger.patient_id}/documents/', self.as_patient, status=403)
+
+    def test_download(self):
+        url = f'/api/patients/{self.patient.patient_id}/documents/{self.document.document_id}/download/'
+        self.assert_same(url, self.as_patient)
+        self.assert_same(url, self.as_patient, status=206, Range='bytes=10-19')
+        self.assert_same(url, self.as_patient, status=416, Range='bytes=9999-')
+        missing = f'/api/patients/{self.patient.patient_id}/documents/999999/download/'
+        self.assert_same(missing, self.as_patient, status=404)
+
+
+class ReplicaRoutingTests(IsolationMixin, TransactionTestCase):
+    """Two replica SQLite files, brought up to date only by ``sync_replicas``.
+
+    A TransactionTestCase, so the primary's rows are committed and visible
+    to the backup.
+    """
+    replicas = ['replica_a', 'replica_b']
+
+    @classmethod
+    def setUpClass(cls):
+        # not configured in settings, so the test runner never creates (or
+        # migrates) them: the files are created by the first sync
+        cls._replica_dir = tempfile.mkdtemp()
+        for alias in cls.replicas:
+            connections.settings[alias] = {
+                **connections['default'].settings_dict,
+                'NAME': os.path.join(cls._replica_dir, f'{alias}.sqlite3'),
+            }
+        cls.databases = {'default', *cls.replicas}
+        # one process, so its local-memory cache is shared by every request
+        cls._replica_override = override_settings(DATABASE_REPLICA_PIN_SECONDS=1, SHARED_CACHE=True)
+        cls._replica_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._replica_override.disable()
+        for alias in cls.replicas:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        shutil.rmtree(cls._replica_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.patient = make_patient()
+        clinician_user = User.objects.create_user(username='clinician', password=None, first_name='C', last_name='L')
+        Clinician.objects.create(user=clinician_user, age=50, gender='Male', speciality='GP')
+        self.writer = self.client_class(headers=bearer(self.patient.user))
+        self.other = self.client_class(headers=bearer(clinician_user))
+        self.url = f'/api/patients/{self.patient.patient_id}/documents/'
+        self.sync()
+
+    def sync(self):
+        for alias in self.replicas:
+            connections[alias].close()
+        call_command('sync_replicas', stdout=io.StringIO())
+
+    def document_count(self, client):
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(response.json())
+
+    def test_writes_are_read_back_from_the_primary_until_the_pin_expires(self):
+        upload = SimpleUploadedFile('a.pdf', PDF + b'replica', content_type='application/pdf')
+        response = self.writer.post(f'{self.url}upload/', {'file': upload})
+        self.assertEqual(response.status_code, 201)
+
+        # the writer reads their own write; everyone else sees the lagging replica
+        self.assertEqual(self.document_count(self.writer), 1)
+        self.assertEqual(self.document_count(self.other), 0)
+
+        # once the pin lapses the writer is back on the (still stale) replica
+        time.sleep(1.1)
+        self.assertEqual(self.document_count(self.writer), 0)
+
+        self.sync()
+        self.assertEqual(self.document_count(self.writer), 1)
+        self.assertEqual(self.document_count(self.other), 1)
+
+    def test_reads_stay_on_the_primary_without_a_shared_cache(self):
+        make_document(self.patient, PDF + b'unsynced')
+        with override_settings(SHARED_CACHE=False):
+            self.assertEqual(self.document_count(self.other), 1)
+        self.assertEqual(self.document_count(self.other), 0)
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        make_document(self.patient, PDF + b'direct')
+        self.assertEqual(Document.objects.count(), 1)
+        self.assertEqual(Document.objects.using('replica_a').count(), 0)
@@ -0,0 +1,50 @@
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from .auth import AUTHZ_EPOCH_CLAIM, load_principal
+
+
+def add_authz_claims(token, principal, epoch):
+    """Sign the caller's role and ownership into ``token``."""
+    token['username'] = principal.username
+    token['is_clinician'] = principal.is_clinician
+    token['patient_id'] = principal.patient_id
+    token['patient_ids'] = list(principal.patient_ids)
+    token['clinician_id'] = principal.clinician_id
+    token[AUTHZ_EPOCH_CLAIM] = epoch
+    return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Login: issue a token pair whose access token carries authz claims."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        principal = load_principal(user.id)
+        return add_authz_claims(token, principal, principal.user.authz_epoch)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh: re-derive authz claims so role changes are picked up."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        principal = load_principal(refresh.payload.get(api_settings.USER_ID_CLAIM))
+        if principal is None:
+            raise AuthenticationFailed(
+                self.error_messages['no_active_account'],
+                'no_active_account',
+            )
+        access = add_authz_claims(refresh.access_token, principal, principal.user.authz_epoch)
+        return {'access': str(access)}
+
+
+class ClaimsTokenObtainPairView(TokenObtainPairView):
+    serializer_class = ClaimsTokenObtainPairSerializer
+
+
+class ClaimsTokenRefreshView(TokenRefreshView):
+    serializer_class = ClaimsTokenRefreshSerializer
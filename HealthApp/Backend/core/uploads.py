@@ -0,0 +1,160 @@
+"""Streaming upload handler for patient PDFs.
+
+``PdfStreamUploadHandler`` replaces Django's memory/temp-file handlers for
+``PatientDocumentUpload``: chunks are written straight to their final path
+under ``MEDIA_ROOT``, the ``%PDF`` signature is checked on the first bytes,
+``MAX_UPLOAD_SIZE`` is enforced while streaming (and up front from
+Content-Length), and a SHA-256 digest is computed on the way through. The
+file lands in a temp name in document storage; the view then renames it to
+its content address (``ContentAddressedStorage.adopt``), so nothing is copied.
+"""
+import hashlib
+import os
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+from .storage import document_storage
+
+PDF_SIGNATURE = b'%PDF'
+
+# Room for multipart boundaries/headers and small form fields on top of the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class StoredUploadedFile(UploadedFile):
+    """An upload already written to document storage under ``storage_name``."""
+
+    def __init__(self, storage_name, name, content_type, size, sha256):
+        super().__init__(file=None, name=name, content_type=content_type, size=size)
+        self.storage_name = storage_name
+        self.sha256 = sha256
+
+    def close(self):
+        # nothing is held open; the parser closes every file when it fails
+        pass
+
+
+class RejectedUpload(namedtuple('RejectedUpload', 'name message status_code')):
+    """A file of a batch upload that was skipped while streaming."""
+
+
+class PdfStreamUploadHandler(FileUploadHandler):
+    """Stream PDFs under ``field_name`` into document storage.
+
+    With ``max_files=1`` any problem aborts the request (``error`` and
+    ``status_code`` say why). With more, each file stands alone: a bad or
+    oversized file is skipped and recorded as a ``RejectedUpload`` while the
+    rest keep streaming. ``outcomes`` lists both kinds in arrival order.
+    """
+    chunk_size = 64 * 1024
+
+    # the open temp file is ``destination``, not ``file``: MultiPartParser
+    # calls ``handler.file.close()`` on any handler that has a ``file``
+
+    def __init__(self, request, patient_id, field_name='file', max_files=1):
+        super().__init__(request)
+        self.patient_id = patient_id
+        self.accepted_field = field_name
+        self.max_files = max_files
+        self.max_size = getattr(settings, 'MAX_UPLOAD_SIZE', None)
+        self.error = None
+        self.status_code = None
+        self.stored = None
+        self.outcomes = []
+        self.destination = None
+        self.storage_name = None
+
+    def _abort(self, message, status_code):
+        if self.max_files > 1:
+            # batch: give up on this file only
+            self.outcomes.append(RejectedUpload(self.file_name, message, status_code))
+            self._discard()
+            raise SkipFile()
+        self.error = message
+        self.status_code = status_code
+        self._discard()
+        raise StopUpload(connection_reset=True)
+
+    def _discard(self):
+        if self.destination is not None:
+            self.destination.close()
+            self.destination = None
+        if self.storage_name:
+            document_storage().delete(self.storage_name)
+            self.storage_name = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        limit = self.max_size * self.max_files + MULTIPART_OVERHEAD if self.max_size else None
+        if limit and content_length and content_length > limit:
+            # reject before reading a single byte of the body
+            self.error = f"File too large (>{self.max_size} bytes)." if self.max_files == 1 else \
+                f"Upload too large (>{self.max_files} files of {self.max_size} bytes)."
+            self.status_code = 413
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        if field_name != self.accepted_field:
+            raise SkipFile()
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if len(self.outcomes) >= self.max_files:
+            if self.max_files > 1:
+                self.outcomes.append(RejectedUpload(file_name, f"Too many files (max {self.max_files}).", 400))
+            raise SkipFile()
+        if self.max_size and content_length and content_length > self.max_size:
+            self._abort(f"File too large (>{self.max_size} bytes).", 413)
+        self.storage_name = document_storage().temp_name()
+        path = document_storage().path(self.storage_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.destination = open(path, 'xb')
+        self.hasher = hashlib.sha256()
+        self.header = b''
+        self.size = 0
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.max_size and self.size > self.max_size:
+            self._abort(f"File too large (>{self.max_size} bytes).", 413)
+        if len(self.header) < len(PDF_SIGNATURE):
+            self.header += raw_data[:len(PDF_SIGNATURE) - len(self.header)]
+            if len(self.header) == len(PDF_SIGNATURE) and self.header != PDF_SIGNATURE:
+                self._abort("Uploaded file is not a valid PDF (missing %PDF header).", 400)
+        self.hasher.update(raw_data)
+        self.destination.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.destination is None:
+            return None
+        self.destination.close()
+        self.destination = None
+        if self.header != PDF_SIGNATURE:
+            message = "Uploaded file is not a valid PDF (missing %PDF header)."
+            if self.max_files > 1:
+                self.outcomes.append(RejectedUpload(self.file_name, message, 400))
+            else:
+                self.error = message
+                self.status_code = 400
+            self._discard()
+            return None
+        stored = StoredUploadedFile(
+            self.storage_name, self.file_name, self.content_type, file_size, self.hasher.hexdigest(),
+        )
+        self.storage_name = None
+        self.outcomes.append(stored)
+        self.stored = stored
+        return stored
+
+    @property
+    def stored_files(self):
+        return [o for o in self.outcomes if isinstance(o, StoredUploadedFile)]
+
+    def upload_interrupted(self):
+        # drop the file that was mid-stream; completed ones are the view's
+        self._discard()
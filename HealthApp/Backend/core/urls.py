@@ -1,38 +1,72 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     RegisterUser, 
     RegisterPatient, 
     RegisterClinician, 
     GetUserDetails,
+    GetMyProfile,
     GetPatientDetails,
     GetClinicianDetails,
-    GetPatients
+    GetPatients,
+    PatientSearch,
+    ClinicianDirectory,
+    ExportNDJSON,
 )
 
 from .views_documents import (
     PatientDocumentUpload,
+    PatientDocumentBatchUpload,
+    ResumableUploadCreate,
+    ResumableUploadView,
+    ResumableUploadComplete,
     DocumentView,
     GetDocuments,
-    DocumentDownload
+    DocumentDownload,
+    DocumentArchive,
+    DocumentSearch,
+    DocumentChanges,
 )
 
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .tokens import ClaimsTokenObtainPairView, ClaimsTokenRefreshView
+
+if settings.ASYNC_VIEWS:
+    # same routes, served by the ASGI-native versions
+    from .views_async import (
+        GetPatientDetails,
+        GetClinicianDetails,
+        GetPatients,
+        GetDocuments,
+        DocumentChanges,
+        DocumentDownload,
+    )
 
 
 urlpatterns = [
     path('register/', RegisterUser.as_view()),
-    path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('login/', ClaimsTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('refresh/', ClaimsTokenRefreshView.as_view(), name='token_refresh'),
     path('user/<str:username>/', GetUserDetails.as_view()),
+    path('me/', GetMyProfile.as_view()),
     # path('login/', LoginView.as_view()),
     path('register-clinician/', RegisterClinician.as_view()),
     path('clinicians/<str:clinician_id>/', GetClinicianDetails.as_view()),
+    path('clinicians/', ClinicianDirectory.as_view()),
     path('register-patient/', RegisterPatient.as_view()),
+    path('patients/search/', PatientSearch.as_view()),
     path('patients/<str:patient_id>/', GetPatientDetails.as_view()),
     path('patients/', GetPatients.as_view()),
+    path('export/<str:kind>/', ExportNDJSON.as_view()),
 
     # Document URLs
     path('patients/<str:patient_id>/documents/upload/', PatientDocumentUpload.as_view()),
+    path('patients/<str:patient_id>/documents/batch-upload/', PatientDocumentBatchUpload.as_view()),
+    path('patients/<str:patient_id>/documents/uploads/', ResumableUploadCreate.as_view()),
+    path('patients/<str:patient_id>/documents/uploads/<uuid:upload_id>/', ResumableUploadView.as_view()),
+    path('patients/<str:patient_id>/documents/uploads/<uuid:upload_id>/complete/', ResumableUploadComplete.as_view()),
+    path('patients/<str:patient_id>/documents/archive/', DocumentArchive.as_view()),
+    path('patients/<str:patient_id>/documents/search/', DocumentSearch.as_view()),
+    path('patients/<str:patient_id>/documents/changes/', DocumentChanges.as_view()),
     path('patients/<str:patient_id>/documents/<str:document_id>/', DocumentView.as_view()),
     path('patients/<str:patient_id>/documents/', GetDocuments.as_view()),
     path('patients/<str:patient_id>/documents/<str:document_id>/download/', DocumentDownload.as_view()),
@@ -1,12 +1,27 @@
 import random
+from django.http import StreamingHttpResponse, Http404
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status, permissions
+from rest_framework import status, permissions, serializers
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import User, Patient, Clinician
-from .serializers import UserSerializer, PatientSerializer, ClinicianSerializer
-from .validators import is_clinician, is_patient
-from .auth import require_auth, check_patient_access, check_clinician_access
+from django.db.models import Count, Max, OuterRef, Subquery
+from .models import User, Patient, Clinician, Document, normalize_speciality
+from .serializers import UserSerializer, PatientSerializer, ClinicianSerializer, ClinicianDirectorySerializer
+from .pagination import KeysetPaginator
+from .fast_serializers import ValuesSerializer
+from .export import EXPORTS, iter_ndjson
+from .search import filter_patients
+from .directory import speciality_facets
+from .conditional import make_etag, last_modified_of, not_modified, set_validators
+from .hashing import hash_password
+from .profile_cache import get_patient_profile, get_clinician_profile, get_user_profile
+from .auth import (
+    require_auth,
+    check_patient_access,
+    check_clinician_access,
+    bump_authz_epoch,
+    visible_patients,
+)
 
 class RegisterUser(APIView):
     def post(self, request):
@@ -20,7 +35,7 @@ class RegisterUser(APIView):
         user = User(first_name=first_name, last_name=last_name)
         username = f"{first_name.lower()}_{random.randint(10000, 99999)}"
         user.username = username
-        user.set_password(password)
+        user.password = hash_password(password)
         user.save()
         return Response(UserSerializer(user).data, status=201)
 
@@ -43,6 +58,7 @@ class RegisterPatient(APIView):
         patient = Patient(user=user, age=age, sex=sex, health_description=health_description)
         
         patient.save()
+        bump_authz_epoch(user.id)
         return Response(PatientSerializer(patient).data, status=201)
     
 class RegisterClinician(APIView):
@@ -62,32 +78,95 @@ class RegisterClinician(APIView):
         clinician = Clinician(user=user, age=age, gender=gender, speciality=speciality)
         
         clinician.save()
+        bump_authz_epoch(user.id)
         return Response(ClinicianSerializer(clinician).data, status=201)
 
 class GetPatients(APIView):
+    paginator = KeysetPaginator(('created_at', 'patient_id'))
+    # Set to PatientSerializer to serialize through model instances instead
+    read_serializer = ValuesSerializer(PatientSerializer)
+
+    @require_auth
+    def get(self, request):
+        if not request.principal.is_clinician:
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+        patients = visible_patients(request.principal)
+        return Response(self.paginator.page(patients, request, self.read_serializer), status=200)
+
+class PatientSearch(APIView):
+    """Filter patients by age range, sex, name prefix and free text.
+
+    Query params: age_min, age_max, sex, name, q, cursor, page_size.
+    """
+    paginator = KeysetPaginator(('created_at', 'patient_id'))
+    read_serializer = ValuesSerializer(PatientSerializer)
+
+    @require_auth
+    def get(self, request):
+        if not request.principal.is_clinician:
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+        params = request.query_params
+        patients = visible_patients(request.principal)
+        try:
+            if params.get('age_min'):
+                patients = patients.filter(age__gte=int(params['age_min']))
+            if params.get('age_max'):
+                patients = patients.filter(age__lte=int(params['age_max']))
+        except ValueError:
+            return Response({'error': 'age_min and age_max must be integers'}, status=400)
+        if params.get('sex'):
+            patients = patients.filter(sex=params['sex'])
+        patients = filter_patients(patients, text=params.get('q'), name_prefix=params.get('name'))
+        return Response(self.paginator.page(patients, request, self.read_serializer), status=200)
+
+class ClinicianDirectory(APIView):
+    """List clinicians (optionally by ?speciality=) with per-speciality counts."""
+    paginator = KeysetPaginator(('speciality_key', 'clinician_id'))
+    read_serializer = ValuesSerializer(ClinicianDirectorySerializer)
+
     @require_auth
     def get(self, request):
-        user = User.objects.get(username=request.user)
-        if not is_clinician(user.id):
+        clinicians = Clinician.objects.all()
+        speciality = request.query_params.get('speciality')
+        if speciality:
+            clinicians = clinicians.filter(speciality_key=normalize_speciality(speciality))
+        payload = self.paginator.page(clinicians, request, self.read_serializer)
+        payload['facets'] = speciality_facets()
+        return Response(payload, status=200)
+
+class ExportNDJSON(APIView):
+    """Stream every patient or clinician as NDJSON for warehouse sync."""
+    @require_auth
+    def get(self, request, kind):
+        if kind not in EXPORTS:
+            raise Http404("Unknown export.")
+        if not request.principal.is_clinician:
             return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
-        patients = Patient.objects.select_related("user").all()
-        if patients:
-            return Response(PatientSerializer(patients, many=True).data, status=200)
-        else:
-            return Response({'error': 'No Patient Data'}, status=204)
+        response = StreamingHttpResponse(iter_ndjson(kind), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{kind}.ndjson"'
+        return response
 
 class GetPatientDetails(APIView):
     @require_auth
     def get(self, request, **args):
         patient_id = args['patient_id']
         try: 
-            user_id = get_user_id(request.user)
             # Check access: patient self OR clinician
-            if not check_patient_access(user_id, patient_id):
+            if not check_patient_access(request.principal, patient_id):
                 return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
-            patient = Patient.objects.select_related("user").get(patient_id=patient_id)
+            # cached profile carries its own validators; a 304 skips serialization
+            patient_id = int(patient_id)
+            entry = get_patient_profile(patient_id)
+            if entry is None or not (request.principal.is_clinician or entry['user_id'] == request.principal.user_id):
+                return Response({'error': 'Patient not found'}, status=404)
+            etag = make_etag('patient', patient_id, *entry['versions'])
+            last_modified = last_modified_of(*entry['versions'])
+            cached = not_modified(request, etag, last_modified)
+            if cached is not None:
+                return cached
 
-            return Response(PatientSerializer(patient).data, status=200)
+            response = Response(entry['data'], status=200)
+            return set_validators(response, etag, last_modified)
         except Exception:
             return Response({'error': 'Patient not found'}, status=404)
         
@@ -96,39 +175,81 @@ class GetClinicianDetails(APIView):
     def get(self, request, **args):
         clinician_id = args['clinician_id']
         try: 
-            user_id = get_user_id(request.user)
-            if not check_clinician_access(user_id, clinician_id):
+            if not check_clinician_access(request.principal, clinician_id):
                 return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
-            clinician = Clinician.objects.select_related("user").get(clinician_id=clinician_id)
-            return Response(ClinicianSerializer(clinician).data, status=200)
+            clinician_id = int(clinician_id)
+            entry = get_clinician_profile(clinician_id)
+            if entry is None or entry['user_id'] != request.principal.user_id:
+                return Response({'error': 'Clinician not found'}, status=404)
+            etag = make_etag('clinician', clinician_id, *entry['versions'])
+            last_modified = last_modified_of(*entry['versions'])
+            cached = not_modified(request, etag, last_modified)
+            if cached is not None:
+                return cached
+            response = Response(entry['data'], status=200)
+            return set_validators(response, etag, last_modified)
         except Exception:
             return Response({'error': 'Clinician not found'}, status=404)
 
 class GetUserDetails(APIView):
     @require_auth
     def get(self, request, username):
-        try:
-            user = User.objects.get(username=request.user)
-            if not str(user.username) == str(username):
-                return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
-            user_data = UserSerializer(user).data
-            try:
-                patient = Patient.objects.get(user_id=user.id)
-                user_data['patient_id'] = patient.patient_id
-            except Exception: 
-                user_data['patient_id'] = ''
-            try:
-                clinician = Clinician.objects.get(user_id=user.id)
-                user_data['clinician_id'] = clinician.clinician_id
-            except Exception: 
-                user_data['clinician_id'] = ''
-            return Response(user_data, status=200)
-        except Exception:
+        principal = request.principal
+        if not str(principal.username) == str(username):
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+        user_data = get_user_profile(principal.user_id)
+        if user_data is None:
             return Response({'error': 'User not found'}, status=404)
+        user_data = dict(user_data)
+        user_data['patient_id'] = principal.patient_id if principal.is_patient else ''
+        user_data['clinician_id'] = principal.clinician_id if principal.is_clinician else ''
+        return Response(user_data, status=200)
 
+class GetMyProfile(APIView):
+    """The caller's user record, role ids and per-patient document stats in one query.
 
+    One row per owned patient (a single row with no patient otherwise),
+    each carrying that patient's own document count and latest upload.
+    """
+    user_fields = UserSerializer.Meta.fields
 
-def get_user_id(username):
-    user = User.objects.get(username=username)
-    return user.id
-        
\ No newline at end of file
+    @require_auth
+    def get(self, request):
+        rows = list(
+            User.objects
+            .filter(id=request.principal.user_id)
+            .annotate(
+                own_clinician_id=Subquery(
+                    Clinician.objects.filter(user_id=OuterRef('pk')).order_by('clinician_id').values('clinician_id')[:1]
+                ),
+            )
+            .values(*self.user_fields, 'own_clinician_id', 'patients__patient_id')
+            .annotate(
+                document_count=Count('patients__documents__document_id'),
+                latest_upload=Max('patients__documents__uploaded_time'),
+            )
+            .order_by('patients__patient_id')
+        )
+        if not rows:
+            return Response({'error': 'User not found'}, status=404)
+        user = rows[0]
+        timestamp = serializers.DateTimeField()
+        user_data = {field: user[field] for field in self.user_fields}
+        user_data['created_at'] = timestamp.to_representation(user['created_at'])
+        patients = [
+            {
+                'patient_id': row['patients__patient_id'],
+                'document_count': row['document_count'],
+                'latest_upload': timestamp.to_representation(row['latest_upload']),
+            }
+            for row in rows if row['patients__patient_id'] is not None
+        ]
+        # '' (not null) for a missing role, matching GetUserDetails
+        own = patients[0] if patients else {'patient_id': '', 'document_count': 0, 'latest_upload': None}
+        user_data['patient_id'] = own['patient_id']
+        user_data['clinician_id'] = user['own_clinician_id'] if user['own_clinician_id'] is not None else ''
+        # stats of the patient above; every owned patient is listed in ``patients``
+        user_data['document_count'] = own['document_count']
+        user_data['latest_upload'] = own['latest_upload']
+        user_data['patients'] = patients
+        return Response(user_data, status=200)
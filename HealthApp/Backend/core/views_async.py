@@ -0,0 +1,197 @@
+"""Async (ASGI-native) versions of the read-only endpoints and the download.
+
+Same URLs, access rules and response bodies as the APIView versions in
+``core.views`` / ``core.views_documents``; ``core.urls`` routes to these when
+``settings.ASYNC_VIEWS`` is on. Database and cache lookups are awaited and file
+bodies are streamed chunk by chunk, so under an ASGI server a request waiting
+on I/O or on a slow client costs a coroutine rather than a worker thread.
+
+These are plain Django views, not DRF ones (DRF dispatch is sync-only), so
+they render JSON with DRF's renderer to keep the bytes identical.
+"""
+import os
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.http import quote_etag
+from django.views import View
+from rest_framework.renderers import JSONRenderer
+
+from .models import Document, DocumentChange
+from .serializers import DocumentSerializer, PatientSerializer
+from .fast_serializers import ValuesSerializer
+from .pagination import InvalidCursor, KeysetPaginator
+from .conditional import make_etag, last_modified_of, not_modified, set_validators
+from .profile_cache import aget_patient_profile, aget_clinician_profile
+from .downloads import file_response
+from .changes import achanges_since
+from .views_documents import document_change_entries
+from .auth import (
+    _as_id,
+    aget_request_principal,
+    check_patient_access,
+    check_clinician_access,
+    visible_patients,
+    visible_documents,
+)
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def require_auth(view_func):
+    """Async ``core.auth.require_auth``: sets ``request.principal`` or answers 401."""
+    @wraps(view_func)
+    async def _wrapped(self, request, *args, **kwargs):
+        principal = await aget_request_principal(request)
+        if not principal:
+            return json_response({'detail': 'Authentication required.'}, status=401)
+        request.principal = principal
+        return await view_func(self, request, *args, **kwargs)
+    return _wrapped
+
+
+def access_denied():
+    return json_response({'detail': 'Access denied.'}, status=403)
+
+
+class GetPatients(View):
+    paginator = KeysetPaginator(('created_at', 'patient_id'))
+    read_serializer = ValuesSerializer(PatientSerializer)
+
+    @require_auth
+    async def get(self, request):
+        if not request.principal.is_clinician:
+            return access_denied()
+        patients = visible_patients(request.principal)
+        try:
+            page = await self.paginator.apage(patients, request, self.read_serializer)
+        except InvalidCursor as exc:
+            return json_response({'detail': exc.detail}, status=400)
+        return json_response(page)
+
+
+class GetPatientDetails(View):
+    @require_auth
+    async def get(self, request, patient_id):
+        if not check_patient_access(request.principal, patient_id):
+            return access_denied()
+        patient_id = _as_id(patient_id)
+        entry = await aget_patient_profile(patient_id) if patient_id is not None else None
+        if entry is None or not (request.principal.is_clinician or entry['user_id'] == request.principal.user_id):
+            return json_response({'error': 'Patient not found'}, status=404)
+        etag = make_etag('patient', patient_id, *entry['versions'])
+        last_modified = last_modified_of(*entry['versions'])
+        cached = not_modified(request, etag, last_modified)
+        if cached is not None:
+            return cached
+        return set_validators(json_response(entry['data']), etag, last_modified)
+
+
+class GetClinicianDetails(View):
+    @require_auth
+    async def get(self, request, clinician_id):
+        if not check_clinician_access(request.principal, clinician_id):
+            return access_denied()
+        clinician_id = _as_id(clinician_id)
+        entry = await aget_clinician_profile(clinician_id) if clinician_id is not None else None
+        if entry is None or entry['user_id'] != request.principal.user_id:
+            return json_response({'error': 'Clinician not found'}, status=404)
+        etag = make_etag('clinician', clinician_id, *entry['versions'])
+        last_modified = last_modified_of(*entry['versions'])
+        cached = not_modified(request, etag, last_modified)
+        if cached is not None:
+            return cached
+        return set_validators(json_response(entry['data']), etag, last_modified)
+
+
+class GetDocuments(View):
+    @require_auth
+    async def get(self, request, patient_id):
+        if not check_patient_access(request.principal, patient_id):
+            return access_denied()
+
+        version = await (
+            visible_patients(request.principal)
+            .filter(patient_id=patient_id)
+            .values_list('documents_version', 'documents_updated_at')
+            .afirst()
+        )
+        if version is not None:
+            etag = make_etag('documents', patient_id, request.get_host(), *version)
+            last_modified = last_modified_of(version[1])
+            cached = not_modified(request, etag, last_modified)
+            if cached is not None:
+                return cached
+
+        queryset = visible_documents(request.principal).filter(patient_id=patient_id).order_by('-uploaded_time')
+        documents = [doc async for doc in queryset]
+        response = json_response(DocumentSerializer(documents, many=True, context={'request': request}).data)
+        if version is not None:
+            set_validators(response, etag, last_modified)
+        return response
+
+
+class DocumentChanges(View):
+    @require_auth
+    async def get(self, request, patient_id):
+        if not check_patient_access(request.principal, patient_id):
+            return access_denied()
+        try:
+            since = max(int(request.GET.get('since', 0)), 0)
+            limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+        except ValueError:
+            return json_response({'detail': 'since and limit must be integers.'}, status=400)
+        limit = max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+        version = await (
+            visible_patients(request.principal)
+            .filter(patient_id=patient_id)
+            .values_list('documents_version', flat=True)
+            .afirst()
+        )
+        if version is None:
+            return json_response({'detail': 'Patient not found.'}, status=404)
+        if since >= version:
+            return json_response({'changes': [], 'cursor': since, 'has_more': False})
+
+        rows = await achanges_since(patient_id, since, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        latest = {row.document_id: row for row in rows}
+        docs = await visible_documents(request.principal).filter(
+            patient_id=patient_id,
+            document_id__in=[row.document_id for row in latest.values() if row.kind != DocumentChange.DELETED],
+        ).ain_bulk()
+
+        changes = document_change_entries(rows, latest, docs, request)
+        return json_response({'changes': changes, 'cursor': rows[-1].seq if rows else since, 'has_more': has_more})
+
+
+class DocumentDownload(View):
+    @require_auth
+    async def get(self, request, patient_id, document_id):
+        if not check_patient_access(request.principal, patient_id):
+            return access_denied()
+
+        try:
+            doc = await visible_documents(request.principal).aget(document_id=document_id, patient_id=patient_id)
+        except (Document.DoesNotExist, ValueError):
+            return json_response({'detail': 'No Document matches the given query.'}, status=404)
+        file_field = doc.file
+        if not file_field:
+            return json_response({'detail': 'File not found.'}, status=404)
+        file_path = file_field.path
+        if not os.path.exists(file_path):
+            return json_response({'detail': 'File missing on disk.'}, status=404)
+
+        etag = quote_etag(doc.sha256) if doc.sha256 else make_etag('document', doc.document_id, file_field.name)
+        return file_response(
+            request, file_field.name, file_path,
+            etag=etag,
+            last_modified=last_modified_of(doc.uploaded_time),
+            filename=os.path.basename(file_path),
+            asynchronous=True,
+        )
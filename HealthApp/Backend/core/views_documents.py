@@ -1,14 +1,56 @@
 import os
-from django.http import FileResponse, Http404
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.utils.http import quote_etag
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, parsers
 from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
 
-from .models import Patient, Document, User
-from .serializers import DocumentSerializer
-from .auth import require_auth, check_patient_access, check_document_delete
-from .views import get_user_id
+from .models import Patient, Document, DocumentChange, UploadSession
+from .serializers import DocumentSerializer, UploadSessionSerializer
+from .uploads import PdfStreamUploadHandler
+from .storage import blob_name, document_storage
+from .blobs import acquire_blobs, discard_unreferenced
+from .resumable import UploadError, create_session, finalize, parse_content_range, write_chunk
+from .conditional import make_etag, last_modified_of, not_modified, set_validators
+from .downloads import file_response
+from .archive import iter_zip
+from .tasks import schedule_text_extraction
+from .search import search_documents
+from .changes import changes_since, record_document_changes
+from .auth import (
+    require_auth,
+    check_patient_access,
+    visible_patients,
+    visible_documents,
+    deletable_documents,
+)
+
+
+def create_stored_document(patient, user_id, temp_name, sha256):
+    """Create a Document for a file already validated and written to ``temp_name``.
+
+    The file is moved to its content address (or dropped if identical content
+    is already stored) and the Document points at that blob; the blob
+    reference and the row are committed together.
+    """
+    doc = Document(patient=patient, uploaded_by_id=user_id, file=blob_name(sha256), sha256=sha256)
+    try:
+        doc.full_clean(exclude=['file'])  # file validated while it was stored
+        with transaction.atomic():
+            document_storage().adopt(temp_name, sha256)
+            doc.save()
+    except Exception:
+        if document_storage().exists(temp_name):
+            document_storage().delete(temp_name)
+        else:
+            discard_unreferenced(sha256, doc.file.name)
+        raise
+    return doc
 
 
 class PatientDocumentUpload(APIView):
@@ -21,23 +63,216 @@ class PatientDocumentUpload(APIView):
         except Patient.DoesNotExist:
             return Response({'detail': 'Patient not found.'}, status=status.HTTP_404_NOT_FOUND)
         
-        user = User.objects.get(username=request.user)
-        user_id = user.id
         # Check access: patient self OR clinician
-        if not check_patient_access(user_id, patient_id):
+        if not check_patient_access(request.principal, patient_id):
             return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
 
-        if 'file' not in request.FILES:
+        # Stream the body straight into storage; size and %PDF signature are
+        # checked while it arrives, so bad uploads are cut off early.
+        handler = PdfStreamUploadHandler(request, patient.patient_id)
+        request._request.upload_handlers = [handler]
+        try:
+            files = request.FILES
+        except Exception:
+            # the file may be stored before the rest of the body fails to parse
+            for stored in handler.stored_files:
+                document_storage().delete(stored.storage_name)
+            raise
+        if handler.error:
+            return Response({'detail': handler.error}, status=handler.status_code)
+
+        if 'file' not in files:
             return Response({'detail': 'No file uploaded (use form-data key "file").'}, status=status.HTTP_400_BAD_REQUEST)
 
-        file_obj = request.FILES['file']
-        # Create Document instance
-        doc = Document(patient=patient, uploaded_by=user, file=file_obj)
+        stored = files['file']
         try:
-            doc.full_clean()  # run validators (size + pdf signature)
-        except Exception as e:
+            doc = create_stored_document(patient, request.principal.user_id, stored.storage_name, stored.sha256)
+        except ValidationError as e:
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        doc.save()
+
+        ser = DocumentSerializer(doc, context={'request': request})
+        return Response(ser.data, status=status.HTTP_201_CREATED)
+
+
+class PatientDocumentBatchUpload(APIView):
+    """Upload several PDFs at once (form-data key "files", repeated).
+
+    Access is checked once; every file is streamed and validated on its own,
+    and the accepted ones are inserted with a single ``bulk_create``. The
+    response lists a result per file, in upload order.
+    """
+    parser_classes = [parsers.MultiPartParser, parsers.FormParser]
+
+    @require_auth
+    def post(self, request, patient_id):
+        try:
+            patient = Patient.objects.get(patient_id=patient_id)
+        except Patient.DoesNotExist:
+            return Response({'detail': 'Patient not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if not check_patient_access(request.principal, patient_id):
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+
+        handler = PdfStreamUploadHandler(
+            request, patient.patient_id, field_name='files', max_files=settings.BATCH_UPLOAD_MAX_FILES,
+        )
+        request._request.upload_handlers = [handler]
+        try:
+            request.FILES
+        except Exception:
+            for stored in handler.stored_files:
+                document_storage().delete(stored.storage_name)
+            raise
+        if handler.error:
+            return Response({'detail': handler.error}, status=handler.status_code)
+        if not handler.outcomes:
+            return Response({'detail': 'No files uploaded (use form-data key "files").'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Every column is set here and the files were validated while they
+        # streamed, so the rows go in as built: no full_clean lookups and no
+        # save() follow-up UPDATE. bulk_create skips the Document signals, so
+        # the change feed and text extraction are handled here. All blob
+        # references are taken up front, before any temp file is moved or
+        # dropped, and commit together with the rows.
+        storage = document_storage()
+        docs = {}
+        blobs = {}
+        for stored in handler.stored_files:
+            name = blob_name(stored.sha256)
+            docs[stored] = Document(
+                patient=patient,
+                uploaded_by_id=request.principal.user_id,
+                file=name,
+                file_path=name,
+                sha256=stored.sha256,
+            )
+            _, size, count = blobs.get(stored.sha256, (name, stored.size, 0))
+            blobs[stored.sha256] = (name, size, count + 1)
+        try:
+            with transaction.atomic():
+                acquire_blobs(blobs)
+                for stored in docs:
+                    storage.adopt(stored.storage_name, stored.sha256, acquire=False)
+                Document.objects.bulk_create(docs.values())
+                record_document_changes(
+                    patient.patient_id,
+                    [(doc.document_id, DocumentChange.CREATED) for doc in docs.values()],
+                )
+                schedule_text_extraction([doc.document_id for doc in docs.values()])
+        except Exception:
+            for stored in docs:
+                if storage.exists(stored.storage_name):
+                    storage.delete(stored.storage_name)
+            for digest, (name, _, _) in blobs.items():
+                discard_unreferenced(digest, name)
+            raise
+
+        results = []
+        for outcome in handler.outcomes:
+            if outcome in docs:
+                ser = DocumentSerializer(docs[outcome], context={'request': request})
+                results.append({'file': outcome.name, 'status': status.HTTP_201_CREATED, 'document': ser.data})
+            else:
+                results.append({'file': outcome.name, 'status': outcome.status_code, 'detail': outcome.message})
+        created = status.HTTP_201_CREATED if docs else status.HTTP_400_BAD_REQUEST
+        return Response({'results': results}, status=created)
+
+
+class ResumableUploadCreate(APIView):
+    """Open a resumable upload session: POST {"size": <total bytes>}."""
+    @require_auth
+    def post(self, request, patient_id):
+        try:
+            patient = Patient.objects.get(patient_id=patient_id)
+        except Patient.DoesNotExist:
+            return Response({'detail': 'Patient not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if not check_patient_access(request.principal, patient_id):
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({'detail': 'size (total bytes) is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = create_session(patient, request.principal.user_id, size)
+        except UploadError as e:
+            return Response({'detail': e.message}, status=e.status_code)
+        response = Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(f'{session.upload_id}/')
+        return response
+
+
+def _upload_session(request, patient_id, upload_id):
+    """The caller's live session, or None."""
+    return UploadSession.objects.filter(
+        upload_id=upload_id,
+        patient_id=patient_id,
+        created_by_id=request.principal.user_id,
+        expires_at__gt=timezone.now(),
+    ).first()
+
+
+class ResumableUploadView(APIView):
+    """GET the committed offset, PUT the next chunk, or DELETE to abandon."""
+    @require_auth
+    def get(self, request, patient_id, upload_id):
+        if not check_patient_access(request.principal, patient_id):
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+        session = _upload_session(request, patient_id, upload_id)
+        if session is None:
+            return Response({'detail': 'Upload not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(UploadSessionSerializer(session).data)
+
+    @require_auth
+    def put(self, request, patient_id, upload_id):
+        if not check_patient_access(request.principal, patient_id):
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+        session = _upload_session(request, patient_id, upload_id)
+        if session is None:
+            return Response({'detail': 'Upload not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        chunk_range = parse_content_range(request.META.get('HTTP_CONTENT_RANGE'))
+        if chunk_range is None:
+            return Response({'detail': 'Content-Range: bytes <start>-<end>/<size> is required.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        start, end = chunk_range
+        try:
+            # read the raw body directly: it never passes through a parser
+            write_chunk(session, request._request, start, end - start + 1)
+        except UploadError as e:
+            return Response({'detail': e.message, 'offset': session.offset}, status=e.status_code)
+        return Response(UploadSessionSerializer(session).data)
+
+    @require_auth
+    def delete(self, request, patient_id, upload_id):
+        if not check_patient_access(request.principal, patient_id):
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+        session = _upload_session(request, patient_id, upload_id)
+        if session is None:
+            return Response({'detail': 'Upload not found.'}, status=status.HTTP_404_NOT_FOUND)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ResumableUploadComplete(APIView):
+    """Turn a fully uploaded session into a Document."""
+    @require_auth
+    def post(self, request, patient_id, upload_id):
+        if not check_patient_access(request.principal, patient_id):
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+        session = _upload_session(request, patient_id, upload_id)
+        if session is None:
+            return Response({'detail': 'Upload not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            sha256 = finalize(session)
+        except UploadError as e:
+            return Response({'detail': e.message, 'offset': session.offset}, status=e.status_code)
+        try:
+            doc = create_stored_document(session.patient, request.principal.user_id, session.temp_name, sha256)
+        except ValidationError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            session.delete()
 
         ser = DocumentSerializer(doc, context={'request': request})
         return Response(ser.data, status=status.HTTP_201_CREATED)
@@ -47,55 +282,182 @@ class GetDocuments(APIView):
     @require_auth
     def get(self, request, patient_id):
         # Access check
-        user_id = get_user_id(request.user)
-        if not check_patient_access(user_id, patient_id):
+        if not check_patient_access(request.principal, patient_id):
             return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
 
-        queryset = Document.objects.filter(patient_id=patient_id).order_by('-uploaded_time')
+        version = (
+            visible_patients(request.principal)
+            .filter(patient_id=patient_id)
+            .values_list('documents_version', 'documents_updated_at')
+            .first()
+        )
+        if version is not None:
+            # download_url is absolute, so the host is part of the representation
+            etag = make_etag('documents', patient_id, request.get_host(), *version)
+            last_modified = last_modified_of(version[1])
+            cached = not_modified(request, etag, last_modified)
+            if cached is not None:
+                return cached
+
+        queryset = visible_documents(request.principal).filter(patient_id=patient_id).order_by('-uploaded_time')
         ser = DocumentSerializer(queryset, many=True, context={'request': request})
-        return Response(ser.data)
+        response = Response(ser.data)
+        if version is not None:
+            set_validators(response, etag, last_modified)
+        return response
+
+
+class DocumentChanges(APIView):
+    """Document changes after ?since=<cursor> (0, the default, replays everything).
+
+    Each entry is a creation or update carrying the current representation, or
+    a deletion tombstone; a document changed several times within one page
+    appears once, at its latest change. Pass the returned ``cursor`` as the
+    next ``since``; ``has_more`` means another page is ready right away.
+    """
+    @require_auth
+    def get(self, request, patient_id):
+        if not check_patient_access(request.principal, patient_id):
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            since = max(int(request.query_params.get('since', 0)), 0)
+            limit = int(request.query_params.get('limit', settings.API_PAGE_SIZE))
+        except ValueError:
+            return Response({'detail': 'since and limit must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+        version = (
+            visible_patients(request.principal)
+            .filter(patient_id=patient_id)
+            .values_list('documents_version', flat=True)
+            .first()
+        )
+        if version is None:
+            return Response({'detail': 'Patient not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if since >= version:
+            # the common polling case: nothing new, one cheap lookup
+            return Response({'changes': [], 'cursor': since, 'has_more': False})
+
+        rows = changes_since(patient_id, since, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        latest = {row.document_id: row for row in rows}
+        docs = visible_documents(request.principal).filter(
+            patient_id=patient_id,
+            document_id__in=[row.document_id for row in latest.values() if row.kind != DocumentChange.DELETED],
+        ).in_bulk()
+
+        changes = document_change_entries(rows, latest, docs, request)
+        return Response({'changes': changes, 'cursor': rows[-1].seq if rows else since, 'has_more': has_more})
+
+
+def document_change_entries(rows, latest, docs, request):
+    """Feed entries for ``rows``, keeping each document's ``latest`` change only."""
+    changes = []
+    for row in rows:
+        if latest[row.document_id] is not row:
+            continue
+        if row.kind == DocumentChange.DELETED:
+            document = None
+        elif row.document_id in docs:
+            document = DocumentSerializer(docs[row.document_id], context={'request': request}).data
+        else:
+            continue  # deleted since; its tombstone is further along the feed
+        changes.append({'seq': row.seq, 'type': row.kind, 'document_id': row.document_id, 'document': document})
+    return changes
+
+
+class DocumentSearch(APIView):
+    """Full-text search over a patient's document contents: ?q=metformin."""
+    @require_auth
+    def get(self, request, patient_id):
+        if not check_patient_access(request.principal, patient_id):
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'detail': 'q (search text) is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', settings.API_PAGE_SIZE)), settings.API_MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({'detail': 'limit must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        hits = search_documents(patient_id, text, max(limit, 1))
+        docs = visible_documents(request.principal).filter(
+            patient_id=patient_id, document_id__in=[document_id for document_id, _, _ in hits],
+        ).in_bulk()
+        results = []
+        for document_id, snippet, score in hits:
+            if document_id in docs:
+                data = DocumentSerializer(docs[document_id], context={'request': request}).data
+                results.append({**data, 'snippet': snippet, 'score': score})
+        return Response({'results': results})
+
+
+class DocumentArchive(APIView):
+    """Stream a ZIP of a patient's documents: all of them, or ?ids=1,2,3."""
+    @require_auth
+    def get(self, request, patient_id):
+        if not check_patient_access(request.principal, patient_id):
+            return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
+
+        queryset = visible_documents(request.principal).filter(patient_id=patient_id)
+        ids = request.query_params.get('ids')
+        if ids:
+            try:
+                queryset = queryset.filter(document_id__in=[int(i) for i in ids.split(',') if i.strip()])
+            except ValueError:
+                return Response({'detail': 'ids must be a comma-separated list of document ids.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        # only names and dates are held; file contents are read while streaming
+        rows = list(queryset.order_by('uploaded_time', 'document_id').values_list('document_id', 'file', 'uploaded_time'))
+        if not rows:
+            return Response({'detail': 'No documents found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        storage = document_storage()
+        entries = (
+            (f'document-{document_id}.pdf', storage.path(name), timezone.localtime(uploaded_time))
+            for document_id, name, uploaded_time in rows
+        )
+        response = StreamingHttpResponse(iter_zip(entries), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="patient-{patient_id}-documents.zip"'
+        return response
 
 
 class DocumentView(APIView):
     """GET metadata or DELETE document."""
     @require_auth
     def get(self, request, patient_id, document_id):
-        user_id = get_user_id(request.user)
-        if not check_patient_access(user_id, patient_id):
+        if not check_patient_access(request.principal, patient_id):
             return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
 
-        doc = get_object_or_404(Document, document_id=document_id, patient_id=patient_id)
+        doc = get_object_or_404(visible_documents(request.principal), document_id=document_id, patient_id=patient_id)
         ser = DocumentSerializer(doc, context={'request': request})
         return Response(ser.data)
 
     @require_auth
     def delete(self, request, patient_id, document_id):
-        user_id = get_user_id(request.user)
-        if not check_patient_access(user_id, patient_id):
+        if not check_patient_access(request.principal, patient_id):
             return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
-        doc = get_object_or_404(Document, document_id=document_id, patient_id=patient_id)
-        if not check_document_delete(user_id, doc):
+        doc = deletable_documents(request.principal).filter(document_id=document_id, patient_id=patient_id).first()
+        if doc is None:
+            # Only pay for the second lookup when telling 404 from 403
+            get_object_or_404(visible_documents(request.principal), document_id=document_id, patient_id=patient_id)
             return Response({'detail': 'Not allowed to delete.'}, status=status.HTTP_403_FORBIDDEN)
 
-        # Remove file from disk
-        stored_path = doc.file.path if doc.file else None
-        doc.delete()
-        if stored_path and os.path.exists(stored_path):
-            try:
-                os.remove(stored_path)
-            except OSError:
-                pass  # swallow errors; log in real app
+        # Drops this row's blob reference; once no other document shares the
+        # blob, its removal is queued for the worker (see core.blobs)
+        with transaction.atomic():
+            doc.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class DocumentDownload(APIView):
     @require_auth
     def get(self, request, patient_id, document_id):
-        user_id = get_user_id(request.user)
-        if not check_patient_access(user_id, patient_id):
+        if not check_patient_access(request.principal, patient_id):
             return Response({'detail': 'Access denied.'}, status=status.HTTP_403_FORBIDDEN)
 
-        doc = get_object_or_404(Document, document_id=document_id, patient_id=patient_id)
+        doc = get_object_or_404(visible_documents(request.principal), document_id=document_id, patient_id=patient_id)
         file_field = doc.file
         if not file_field:
             raise Http404("File not found.")
@@ -103,9 +465,12 @@ class DocumentDownload(APIView):
         if not os.path.exists(file_path):
             raise Http404("File missing on disk.")
 
-        # stream
-        response = FileResponse(open(file_path, 'rb'), content_type='application/pdf')
-        # recommended filename in Content-Disposition
-        filename = os.path.basename(file_path)
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
\ No newline at end of file
+        # content digest is a natural strong validator; older uploads have none
+        etag = quote_etag(doc.sha256) if doc.sha256 else make_etag('document', doc.document_id, file_field.name)
+        return file_response(
+            request, file_field.name, file_path,
+            etag=etag,
+            last_modified=last_modified_of(doc.uploaded_time),
+            # recommended filename in Content-Disposition
+            filename=os.path.basename(file_path),
+        )
\ No newline at end of file
@@ -4,6 +4,6 @@
 
 import { jsonRequest } from "./client";
 
-export async function fetchProfile(accessToken, username) {
-  return jsonRequest(`/user/${username}`, { method: "GET" }, accessToken);
+export async function fetchProfile(accessToken) {
+  return jsonRequest(`/me/`, { method: "GET" }, accessToken);
 }
\ No newline at end of file
@@ -5,6 +5,7 @@ import { jsonRequest } from "../api/client";
 
 const Patients = () => {
   const [patients, setPatients] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [selectedPatientId, setSelectedPatientId] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState("");
@@ -16,7 +17,8 @@ const Patients = () => {
       try {
         const accessToken = access;
         const response = await jsonRequest(`/patients/`, { method: "GET" }, accessToken);
-        setPatients(response);
+        setPatients(response.results);
+        setNextCursor(response.next);
       } catch (err) {
         setError(err.message);
       } finally {
@@ -27,6 +29,18 @@ const Patients = () => {
     fetchPatients();
   }, []);
 
+  const loadMore = async () => {
+    try {
+      const response = await jsonRequest(
+        `/patients/?cursor=${encodeURIComponent(nextCursor)}`, { method: "GET" }, access
+      );
+      setPatients((prev) => [...prev, ...response.results]);
+      setNextCursor(response.next);
+    } catch (err) {
+      setError(err.message);
+    }
+  };
+
   if (loading) return <div className="text-center p-6">Loading patients...</div>;
   if (error) return <div className="text-red-500 text-center p-6">{error}</div>;
 
@@ -54,6 +68,14 @@ const Patients = () => {
             </div>
           ))
         )}
+        {nextCursor && (
+          <button
+            onClick={loadMore}
+            className="w-full px-4 py-2 rounded text-white bg-blue-600 hover:bg-blue-700"
+          >
+            Load more
+          </button>
+        )}
       </div>
 
       {/* Right side: PatientDetails */}
@@ -93,7 +93,7 @@ export function AuthProvider({ children, autoLoginAfterRegister = true }) {
       // fetch user profile after login so we have user info
       let profile = null;
       try {
-        profile = await fetchProfile(tokens.access, username);
+        profile = await fetchProfile(tokens.access);
       } catch (profileErr) {
         // Non-fatal; backend might not have /profile/
         console.warn("Profile fetch failed", profileErr);